@@ -0,0 +1,251 @@
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from database import MARK_BANDS, PASS_MARK
+from pivot import PARTS, QUESTION_COUNT, group_starts, scatter_marks
+
+TARGET_PATTERN = re.compile(r"^Q([1-6])([a-d])?$")
+
+
+def _round(value):
+    """Round for JSON output, mapping NaN/inf to None"""
+    if value is None or not np.isfinite(value):
+        return None
+    return round(float(value), 2)
+
+
+def progression_analysis(rows):
+    """Compute per-student and cohort progression between two exams
+
+    ``rows`` is the output of ResultsDatabase.get_progression_rows: one row
+    per (student, question) with both exams side by side. The whole cohort
+    is processed as arrays, so the cost does not grow with per-student work.
+    """
+    analysis = {
+        "cohort": {"paired_students": 0},
+        "question_improvement": {},
+        "students": [],
+    }
+    if not rows:
+        return analysis
+
+    data = np.array(rows, dtype=object)
+    groups, starts = group_starts(data[:, 0], data[:, 1])
+    count = len(starts)
+
+    from_totals = data[starts, 2].astype(float)
+    to_totals = data[starts, 3].astype(float)
+    deltas = to_totals - from_totals
+
+    from_marks = scatter_marks(groups, data[:, 4], data[:, 5:9], count)
+    to_marks = scatter_marks(groups, data[:, 4], data[:, 9:13], count)
+    part_deltas = to_marks - from_marks
+    question_deltas = part_deltas.sum(axis=2)
+
+    # Cohort-level effect sizes
+    mean_delta = deltas.mean()
+    sd_delta = deltas.std(ddof=1) if count > 1 else np.nan
+    pooled_sd = (
+        np.sqrt((from_totals.var(ddof=1) + to_totals.var(ddof=1)) / 2)
+        if count > 1
+        else np.nan
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cohens_dz = mean_delta / sd_delta
+        cohens_d = mean_delta / pooled_sd
+        t_statistic = mean_delta / (sd_delta / np.sqrt(count))
+
+    analysis["cohort"] = {
+        "paired_students": int(count),
+        "average_from": _round(from_totals.mean()),
+        "average_to": _round(to_totals.mean()),
+        "average_delta": _round(mean_delta),
+        "std_dev_delta": _round(sd_delta),
+        "cohens_d": _round(cohens_d),
+        "cohens_dz": _round(cohens_dz),
+        "t_statistic": _round(t_statistic),
+        "improved": int((deltas > 0).sum()),
+        "declined": int((deltas < 0).sum()),
+        "unchanged": int((deltas == 0).sum()),
+    }
+
+    from_question_avg = from_marks.sum(axis=2).mean(axis=0)
+    to_question_avg = to_marks.sum(axis=2).mean(axis=0)
+    part_delta_avg = part_deltas.mean(axis=0)
+    for q_index in range(QUESTION_COUNT):
+        analysis["question_improvement"][f"Q{q_index + 1}"] = {
+            "average_from": _round(from_question_avg[q_index]),
+            "average_to": _round(to_question_avg[q_index]),
+            "average_delta": _round(question_deltas[:, q_index].mean()),
+            "improved_students": int((question_deltas[:, q_index] > 0).sum()),
+            "part_delta": {
+                part: _round(part_delta_avg[q_index, p_index])
+                for p_index, part in enumerate(PARTS)
+            },
+        }
+
+    analysis["students"] = [
+        {
+            "roll_number": roll_number,
+            "academic_year": academic_year,
+            "from_total": from_total,
+            "to_total": to_total,
+            "delta": delta,
+        }
+        for roll_number, academic_year, from_total, to_total, delta in zip(
+            data[starts, 0].tolist(),
+            data[starts, 1].tolist(),
+            from_totals.tolist(),
+            to_totals.tolist(),
+            deltas.tolist(),
+        )
+    ]
+    return analysis
+
+
+class MarkMatrixCache:
+    """Small LRU of cohort mark matrices, keyed by cohort and data stamp"""
+
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, stamp, loader):
+        """Return the cached matrix for key, reloading it if stamp moved"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == stamp:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        matrix = loader()
+        with self._lock:
+            self._entries[key] = (stamp, matrix)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return matrix
+
+
+def _distribution(totals):
+    """Count totals per mark band"""
+    edges = [low for _, low, _ in MARK_BANDS[1:]]
+    counts = np.bincount(np.digitize(totals, edges), minlength=len(MARK_BANDS))
+    return {name: int(count) for (name, _, _), count in zip(MARK_BANDS, counts)}
+
+
+def _summary(totals, pass_mark):
+    passed = totals >= pass_mark
+    return {
+        "total_students": int(len(totals)),
+        "average_marks": _round(totals.mean()) if len(totals) else 0,
+        "highest_marks": _round(totals.max()) if len(totals) else None,
+        "lowest_marks": _round(totals.min()) if len(totals) else None,
+        "passed_students": int(passed.sum()),
+        "pass_percentage": (round(float(passed.mean() * 100), 2) if len(totals) else 0),
+        "student_distribution": _distribution(totals),
+    }
+
+
+def _target_arrays(spec, default, name):
+    """Expand {"Q4": x, "Q2b": y, "*": z} into part and question arrays"""
+    parts = np.full((QUESTION_COUNT, len(PARTS)), default, dtype=float)
+    questions = np.full(QUESTION_COUNT, default, dtype=float)
+    total = default
+
+    if isinstance(spec, (int, float)):
+        spec = {"*": spec}
+    for target, value in (spec or {}).items():
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid {name} value for {target}: {value!r}")
+
+        if target == "*":
+            parts[:, :] = value
+            continue
+        if target == "total":
+            total = value
+            continue
+
+        match = TARGET_PATTERN.match(target)
+        if not match:
+            raise ValueError(f"Invalid {name} target: {target}")
+        q_index = int(match.group(1)) - 1
+        if match.group(2):
+            parts[q_index, PARTS.index(match.group(2))] = value
+        else:
+            questions[q_index] = value
+    return parts, questions, total
+
+
+def simulate_grading(matrix, transformations):
+    """Apply what-if grading rules to a cohort and compare with the baseline
+
+    transformations may contain ``scale``, ``offsets`` and ``caps`` (each a
+    number for every part, or a mapping keyed by part "Q4b", question "Q4",
+    "*" or "total") and ``pass_mark``. Rules apply per part, then per
+    question, then to the total, in scale, offset, cap order. Question
+    offsets only go to students who attempted the question. The stored
+    total moves by the change in question marks, so sheet totals that
+    disagree with their parts keep their difference.
+    """
+    pass_mark = float(transformations.get("pass_mark", PASS_MARK))
+    part_scale, question_scale, total_scale = _target_arrays(
+        transformations.get("scale"), 1.0, "scale"
+    )
+    part_offset, question_offset, total_offset = _target_arrays(
+        transformations.get("offsets"), 0.0, "offset"
+    )
+    part_cap, question_cap, total_cap = _target_arrays(
+        transformations.get("caps"), np.inf, "cap"
+    )
+
+    marks = matrix.marks
+    new_marks = np.clip(marks * part_scale + part_offset, 0, part_cap)
+
+    old_questions = marks.sum(axis=2)
+    new_questions = new_marks.sum(axis=2)
+    attempted = old_questions > 0
+    new_questions = np.clip(
+        new_questions * question_scale + question_offset * attempted,
+        0,
+        question_cap,
+    )
+
+    new_totals = matrix.totals + (new_questions - old_questions).sum(axis=1)
+    new_totals = np.clip(new_totals * total_scale + total_offset, 0, total_cap)
+
+    baseline_passed = matrix.totals >= PASS_MARK
+    simulated_passed = new_totals >= pass_mark
+    changed = (new_totals != matrix.totals) | (baseline_passed != simulated_passed)
+    indices = np.flatnonzero(changed)
+
+    return {
+        "pass_mark": pass_mark,
+        "baseline": _summary(matrix.totals, PASS_MARK),
+        "simulated": _summary(new_totals, pass_mark),
+        "changed_students": int(len(indices)),
+        "newly_passed": int((simulated_passed & ~baseline_passed).sum()),
+        "newly_failed": int((baseline_passed & ~simulated_passed).sum()),
+        "affected_students": [
+            {
+                "roll_number": roll_number,
+                "before": before,
+                "after": round(after, 2),
+                "passed_before": passed_before,
+                "passed_after": passed_after,
+            }
+            for roll_number, before, after, passed_before, passed_after in zip(
+                matrix.roll_numbers[indices].tolist(),
+                matrix.totals[indices].tolist(),
+                new_totals[indices].tolist(),
+                baseline_passed[indices].tolist(),
+                simulated_passed[indices].tolist(),
+            )
+        ],
+    }
@@ -8,32 +8,66 @@ from flask import (
     session,
     jsonify,
     send_file,
+    Response,
+    stream_with_context,
+    make_response,
 )
 from database import (
     init_db,
+    import_students,
     register_student,
     register_teacher,
     verify_student,
     verify_teacher,
     Database,
     ResultsDatabase,
+    BatchStore,
+    CUBE_DIMENSIONS,
 )
 from functools import wraps
 import os
 from werkzeug.utils import secure_filename
+from passwords import hasher
+from maintenance import create_scheduler
 from image_to_text import extract_text_from_image
 from text_to_json import process_text_with_image
-import pandas as pd
+from ingest import process_single_image, save_scanned_results
+from exports import (
+    iter_wide_rows,
+    iter_cohorts,
+    iter_zip,
+    iter_file_chunks,
+    prefetch,
+    write_xlsx_sheets,
+    iter_csv,
+    iter_ndjson,
+    write_xlsx,
+    write_parquet,
+    EXPORT_FORMATS,
+)
+from pivot import (
+    MARK_COLUMNS,
+    build_mark_matrix,
+    iter_mark_matrices,
+    matrix_from_results,
+)
+from analytics import (
+    progression_analysis,
+    simulate_grading,
+    MarkMatrixCache,
+)
 import json
+import openpyxl
 from PIL import Image
 from datetime import datetime
 import re
-import shutil
-from zipfile import ZipFile
-import tempfile
-import openpyxl
-import time
-import threading
+import csv
+import io
+import itertools
+import hashlib
+import multiprocessing
+import unicodedata
+from urllib.parse import quote
 
 app = Flask(__name__)
 app.secret_key = "your_secret_key_here"  # Change this to a secure secret key
@@ -42,7 +76,14 @@ app.secret_key = "your_secret_key_here"  # Change this to a secure secret key
 init_db()
 
 db = Database()
-db_results = ResultsDatabase()
+# Password hashing workers re-import the main script, and with it this
+# module; only the app process itself may reset the results
+db_results = ResultsDatabase(
+    reset=multiprocessing.current_process().name == "MainProcess"
+)
+mark_matrices = MarkMatrixCache()
+upload_batches = BatchStore()
+maintenance = create_scheduler(db_results, upload_batches)
 
 # Add these configurations
 UPLOAD_FOLDER = "uploads"
@@ -52,10 +93,18 @@ app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 # Create uploads directory if it doesn't exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+VIEW_MARKS_PAGE_SIZE = 100
+
 TEMP_FOLDER = "temp"
 os.makedirs(TEMP_FOLDER, exist_ok=True)
 
 
+@app.before_request
+def start_maintenance():
+    # Started on the first request so the reloader's watcher process never runs it
+    maintenance.start()
+
+
 # Helper function to check allowed file extensions
 def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -73,6 +122,35 @@ def login_required(f):
     return decorated_function
 
 
+def make_etag(*parts):
+    """Build a strong ETag value from the parts identifying a response"""
+    key = "\x1f".join(str(part) for part in parts)
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def cohort_etag(class_year, subject, exam_type, *variant):
+    """ETag for a response computed from one cohort's data"""
+    stamp = db_results.get_cohort_stamp(class_year, subject, exam_type)
+    return make_etag(request.path, class_year, subject, exam_type, stamp, *variant)
+
+
+def not_modified(etag):
+    """Return a 304 response if the client already has this ETag"""
+    if request.if_none_match.contains(etag):
+        return with_cache_headers(make_response("", 304), etag)
+    return None
+
+
+def with_cache_headers(response, etag):
+    """Mark a per-user response as revalidate-before-reuse"""
+    response.set_etag(etag)
+    # Responses depend on the login cookie: browsers may keep them, shared
+    # proxies must not, and every reuse is revalidated with If-None-Match
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.vary.add("Cookie")
+    return response
+
+
 @app.route("/")
 def index():
     return render_template("portal.html")
@@ -107,6 +185,9 @@ def student_register():
             )
 
             if success:
+                # Results uploaded before registration move to the new department
+                db_results.refresh_cube_for_roll(student_id)
+                db_results.roll_numbers.add(student_id)
                 return (
                     jsonify(
                         {
@@ -174,6 +255,71 @@ def teacher_register():
     return render_template("teacher_register.html")
 
 
+# Accepted roster column headers (lowercased, without spaces/underscores)
+ROSTER_COLUMNS = {
+    "id": "id",
+    "studentid": "id",
+    "rollnumber": "id",
+    "fullname": "full_name",
+    "name": "full_name",
+    "department": "department",
+    "dept": "department",
+    "password": "password",
+}
+
+
+def read_roster(file):
+    """Read roster rows from an uploaded CSV or XLSX file"""
+    if file.filename.lower().endswith(".xlsx"):
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        rows = workbook.active.iter_rows(values_only=True)
+    else:
+        rows = csv.reader(io.TextIOWrapper(file.stream, encoding="utf-8-sig"))
+
+    headers = next(rows, None) or []
+    columns = [
+        ROSTER_COLUMNS.get(str(header or "").lower().replace(" ", "").replace("_", ""))
+        for header in headers
+    ]
+    for values in rows:
+        if not any(values):
+            continue
+        yield {
+            column: str(value).strip() if value is not None else ""
+            for column, value in zip(columns, values)
+            if column
+        }
+
+
+@app.route("/api/roster/import", methods=["POST"])
+@login_required
+def import_roster():
+    if session.get("user_type") != "teacher":
+        return jsonify({"success": False, "message": "Unauthorized access"}), 403
+
+    file = request.files.get("file")
+    if not file or not file.filename:
+        return jsonify({"success": False, "message": "No roster file uploaded"}), 400
+
+    try:
+        results = import_students(list(read_roster(file)))
+        imported = [result["id"] for result in results if result["success"]]
+        # Results uploaded before these students existed move to their department
+        db_results.refresh_cube_for_rolls(imported)
+        for student_id in imported:
+            db_results.roll_numbers.add(student_id)
+
+        return jsonify(
+            {
+                "success": len(imported) == len(results),
+                "imported": len(imported),
+                "results": results,
+            }
+        )
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
+
 @app.route("/student/login", methods=["GET", "POST"])
 def student_login():
     if request.method == "POST":
@@ -262,7 +408,35 @@ def student_dashboard():
     if session.get("user_type") != "student":
         flash("Unauthorized access", "error")
         return redirect(url_for("index"))
-    return render_template("student_dashboard.html", name=session.get("full_name"))
+    return render_template(
+        "student_dashboard.html",
+        name=session.get("full_name"),
+        summary=db_results.get_student_summary(session.get("user_id")),
+    )
+
+
+@app.route("/api/student/results")
+@login_required
+def student_results():
+    if session.get("user_type") != "student":
+        return jsonify({"success": False, "message": "Unauthorized access"}), 403
+
+    summary = db_results.get_student_summary(session.get("user_id"))
+    if summary is None:
+        return jsonify({"success": False, "message": "No results published yet"}), 404
+    return jsonify({"success": True, "summary": summary})
+
+
+@app.route("/api/publish-results", methods=["POST"])
+@login_required
+def publish_results():
+    if session.get("user_type") != "teacher":
+        return jsonify({"success": False, "message": "Unauthorized access"}), 403
+
+    published = db_results.publish_student_summaries()
+    if published is None:
+        return jsonify({"success": False, "message": "Failed to publish results"}), 500
+    return jsonify({"success": True, "published": published})
 
 
 @app.route("/teacher/dashboard")
@@ -285,6 +459,36 @@ def logout():
     return redirect(url_for("index"))
 
 
+@app.route("/api/system/stats")
+@login_required
+def system_stats():
+    if session.get("user_type") != "teacher":
+        return jsonify({"success": False, "message": "Unauthorized access"}), 403
+
+    return jsonify(
+        {
+            "password_hashing": hasher.get_stats(),
+            "result_writes": db_results.writer.get_stats(),
+            "result_reads": db_results.readers.get_stats(),
+            "maintenance": maintenance.get_stats(),
+            "roll_numbers": db_results.roll_numbers.get_stats(),
+        }
+    )
+
+
+@app.route("/api/system/maintenance/<task>", methods=["POST"])
+@login_required
+def run_maintenance(task):
+    if session.get("user_type") != "teacher":
+        return jsonify({"success": False, "message": "Unauthorized access"}), 403
+
+    try:
+        record = maintenance.run(task)
+    except KeyError:
+        return jsonify({"success": False, "message": "Unknown task"}), 404
+    return jsonify({"success": record["status"] == "ok", "last_run": record})
+
+
 @app.route("/upload")
 @login_required
 def upload_page():
@@ -304,14 +508,198 @@ def get_analysis():
     if not all([year, subject, exam_type]):
         return jsonify({"error": "Missing required parameters"}), 400
 
+    etag = cohort_etag(year, subject, exam_type)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
     try:
         analysis = db_results.get_detailed_analysis(year, subject, exam_type)
-        return jsonify(analysis)
+        return with_cache_headers(jsonify(analysis), etag)
     except Exception as e:
         print(f"Analysis error: {str(e)}")
         return jsonify({"error": "Failed to fetch analysis"}), 500
 
 
+@app.route("/api/cohort-roster")
+@login_required
+def get_cohort_roster():
+    if session.get("user_type") != "teacher":
+        return jsonify({"error": "Unauthorized access"}), 403
+
+    year = request.args.get("year")
+    subject = request.args.get("subject")
+    exam_type = request.args.get("examType")
+    department = request.args.get("department")
+
+    if not all([year, subject, exam_type]):
+        return jsonify({"error": "Missing required parameters"}), 400
+
+    try:
+        return jsonify(
+            {
+                "students": db_results.get_cohort_roster(
+                    year, subject, exam_type, department
+                )
+            }
+        )
+    except Exception as e:
+        print(f"Roster error: {str(e)}")
+        return jsonify({"error": "Failed to fetch roster"}), 500
+
+
+@app.route("/api/shards")
+@login_required
+def list_shards():
+    if session.get("user_type") != "teacher":
+        return jsonify({"error": "Unauthorized access"}), 403
+
+    return jsonify({"frozen_years": db_results.shards.frozen_years()})
+
+
+@app.route("/api/shards/freeze", methods=["POST"])
+@login_required
+def freeze_shard():
+    """Archive a closed academic year into its own read-only file"""
+    if session.get("user_type") != "teacher":
+        return jsonify({"success": False, "message": "Unauthorized access"}), 403
+
+    data = request.get_json(silent=True) or {}
+    academic_year = data.get("academicYear")
+    if not academic_year:
+        return jsonify({"success": False, "message": "Missing academic year"}), 400
+
+    try:
+        archived = db_results.shards.freeze(academic_year, db_results.writer)
+        return jsonify({"success": True, "archived": archived})
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    except Exception as e:
+        print(f"Freeze error: {str(e)}")
+        return jsonify({"success": False, "message": str(e)}), 500
+
+
+@app.route("/api/rank")
+@login_required
+def get_rank():
+    year = request.args.get("year")
+    subject = request.args.get("subject")
+    exam_type = request.args.get("examType")
+    roll_number = request.args.get("rollNumber")
+
+    if session.get("user_type") == "student":
+        roll_number = session.get("user_id")
+    if not all([year, subject, exam_type, roll_number]):
+        return jsonify({"error": "Missing required parameters"}), 400
+
+    try:
+        standing = db_results.get_student_standing(
+            year, subject, exam_type, roll_number
+        )
+        if not standing:
+            return jsonify({"error": "Result not found"}), 404
+        return jsonify({"roll_number": roll_number, "results": standing})
+    except Exception as e:
+        print(f"Rank error: {str(e)}")
+        return jsonify({"error": "Failed to fetch rank"}), 500
+
+
+@app.route("/api/rollup")
+@login_required
+def get_rollup():
+    """Drill down / roll up the precomputed results cube.
+
+    ``dims`` is a comma separated list of dimensions to group by; any
+    dimension can also be passed as a query parameter to filter on it.
+    """
+    dims = [d for d in request.args.get("dims", "").split(",") if d]
+    filters = {
+        dimension: request.args[dimension]
+        for dimension in CUBE_DIMENSIONS
+        if request.args.get(dimension)
+    }
+
+    try:
+        cells = db_results.rollup(dims, filters)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Rollup error: {str(e)}")
+        return jsonify({"error": "Failed to fetch rollup"}), 500
+
+    return jsonify(
+        {
+            "dimensions": dims,
+            "filters": filters,
+            "drill_down": [d for d in CUBE_DIMENSIONS if d not in dims],
+            "cells": cells,
+        }
+    )
+
+
+@app.route("/api/progression")
+@login_required
+def get_progression():
+    year = request.args.get("year")
+    subject = request.args.get("subject")
+    academic_year = request.args.get("academicYear")
+    from_exam = request.args.get("from", "MID1")
+    to_exam = request.args.get("to", "MID2")
+
+    if not all([year, subject]):
+        return jsonify({"error": "Missing required parameters"}), 400
+
+    try:
+        rows = db_results.get_progression_rows(
+            year, subject, from_exam, to_exam, academic_year
+        )
+        analysis = progression_analysis(rows)
+        analysis["from_exam"] = from_exam
+        analysis["to_exam"] = to_exam
+        return jsonify(analysis)
+    except Exception as e:
+        print(f"Progression error: {str(e)}")
+        return jsonify({"error": "Failed to fetch progression"}), 500
+
+
+def get_mark_matrix(class_year, subject, exam_type):
+    """Get a cohort's mark matrix, reusing the cached one while unchanged"""
+    # The stamp, unlike the bare version, also moves when the tables are
+    # recreated, so a matrix of replaced data is never served
+    stamp = db_results.get_cohort_stamp(class_year, subject, exam_type)
+    return mark_matrices.get(
+        (class_year, subject, exam_type),
+        stamp,
+        lambda: build_mark_matrix(
+            db_results.get_mark_rows(class_year, subject, exam_type)
+        ),
+    )
+
+
+@app.route("/api/what-if", methods=["POST"])
+@login_required
+def what_if():
+    if session.get("user_type") != "teacher":
+        return jsonify({"success": False, "message": "Unauthorized access"}), 403
+
+    data = request.get_json() or {}
+    year = data.get("year")
+    subject = data.get("subject")
+    exam_type = data.get("examType")
+
+    if not all([year, subject, exam_type]):
+        return jsonify({"error": "Missing required parameters"}), 400
+
+    try:
+        matrix = get_mark_matrix(year, subject, exam_type)
+        return jsonify(simulate_grading(matrix, data))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"What-if error: {str(e)}")
+        return jsonify({"error": "Failed to simulate grading"}), 500
+
+
 def process_files(files):
     results = []
     for file in files:
@@ -458,16 +846,19 @@ def upload_folder():
                 400,
             )
 
-        # Save to database
-        db_results.save_results(results, class_year, subject, exam_type, academic_year)
+        # Snap misread roll numbers to registered students, then save
+        _, roll_numbers = save_scanned_results(
+            db_results, results, class_year, subject, exam_type, academic_year
+        )
 
-        # Store in session for display
-        session["upload_results"] = results
+        # Store server-side; the session only carries the batch ID
+        session["upload_batch_id"] = upload_batches.create(session["user_id"], results)
 
         return jsonify(
             {
                 "success": True,
                 "message": f"Successfully processed {len(results)} files",
+                "roll_numbers": roll_numbers,
                 "redirect": url_for("show_results"),
             }
         )
@@ -480,73 +871,6 @@ def upload_folder():
         )
 
 
-def process_single_image(file_path):
-    """Process a single image file and return extracted data."""
-    try:
-        # Extract text from image
-        extracted_result = extract_text_from_image(file_path)
-
-        if not extracted_result or not isinstance(extracted_result, dict):
-            print(f"Invalid extraction result from {file_path}")
-            return None
-
-        # Get the extracted text from the result
-        extracted_text = extracted_result.get("text")
-        if not extracted_text:
-            print(f"No text content extracted from {file_path}")
-            return None
-
-        # Process the extracted text into structured data
-        processed_data = process_text_with_image(extracted_text, file_path)
-
-        if not processed_data:
-            print(f"Failed to process data from {file_path}")
-            return None
-
-        return validate_processed_data(processed_data)
-
-    except Exception as e:
-        print(f"Error processing {file_path}: {str(e)}")
-        return None
-
-
-def validate_processed_data(data):
-    """Validate processed data structure."""
-    if not isinstance(data, dict):
-        return None
-
-    # Ensure required fields exist
-    required_fields = ["roll_number", "questions", "total_marks"]
-    if not all(field in data for field in required_fields):
-        return None
-
-    # Validate questions structure
-    questions = data.get("questions", {})
-    if not isinstance(questions, dict):
-        return None
-
-    # Validate question data structure
-    for q_num in range(1, 7):
-        q_key = f"Q{q_num}"
-        if q_key not in questions:
-            questions[q_key] = {"a": 0, "b": 0, "c": 0, "d": 0}
-            continue
-
-        q_data = questions[q_key]
-        if not isinstance(q_data, dict) or not all(
-            part in q_data for part in ["a", "b", "c", "d"]
-        ):
-            return None
-
-        # Validate mark values
-        for part in ["a", "b", "c", "d"]:
-            mark = q_data[part]
-            if not isinstance(mark, (int, float)) or not (0 <= mark <= 8):
-                q_data[part] = 0
-
-    return data
-
-
 def extract_roll_number(text):
     """Extract roll number from text"""
     match = re.search(r"Roll No:?\s*([A-Z0-9]+)", text)
@@ -633,6 +957,50 @@ def get_or_create_subject(subject_name, class_name, academic_year):
         return cursor.lastrowid
 
 
+def attachment_names(download_name):
+    """Content-Disposition filename parameters, quoted as send_file does
+
+    Names that are not ASCII get an ASCII filename and an RFC 5987
+    filename* with the full name.
+    """
+    try:
+        download_name.encode("ascii")
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize("NFKD", download_name)
+        simple = simple.encode("ascii", "ignore").decode("ascii")
+        quoted = quote(download_name, safe="!#$&+-.^_`|~")
+        return {"filename": simple, "filename*": f"UTF-8''{quoted}"}
+    return {"filename": download_name}
+
+
+def send_export(headers, rows, export_format, basename):
+    """Send rows as a download in the requested export format
+
+    Text formats are streamed to the client as they are produced; binary
+    formats are built in a spooled buffer and sent when complete.
+    """
+    mimetype = EXPORT_FORMATS[export_format]
+    download_name = f"{basename}.{export_format}"
+
+    if export_format in ("csv", "ndjson"):
+        generate = iter_csv if export_format == "csv" else iter_ndjson
+        response = Response(
+            stream_with_context(generate(headers, rows)), mimetype=mimetype
+        )
+        response.headers.set(
+            "Content-Disposition", "attachment", **attachment_names(download_name)
+        )
+        return response
+
+    write = write_xlsx if export_format == "xlsx" else write_parquet
+    return send_file(
+        write(headers, rows),
+        mimetype=mimetype,
+        as_attachment=True,
+        download_name=download_name,
+    )
+
+
 @app.route("/results")
 @login_required
 def show_results():
@@ -640,8 +1008,7 @@ def show_results():
         flash("Unauthorized access", "error")
         return redirect(url_for("index"))
 
-    # Get results from session
-    json_data = session.get("upload_results", [])
+    json_data = upload_batches.load(session.get("upload_batch_id"), session["user_id"])
 
     return render_template("results.html", json_data=json_data)
 
@@ -652,14 +1019,15 @@ def delete_last():
     if session.get("user_type") != "teacher":
         return jsonify({"success": False, "message": "Unauthorized access"}), 403
 
-    json_data = session.get("upload_results", [])
+    batch_id = session.get("upload_batch_id")
+    json_data = upload_batches.load(batch_id, session["user_id"])
 
     if not json_data:
         return jsonify({"success": False, "message": "No entries to delete"}), 400
 
     # Remove the last entry
     json_data.pop()
-    session["upload_results"] = json_data
+    upload_batches.replace(batch_id, session["user_id"], json_data)
 
     return jsonify({"success": True, "message": "Last entry deleted successfully"})
 
@@ -671,45 +1039,41 @@ def download_excel():
         flash("Unauthorized access", "error")
         return redirect(url_for("index"))
 
-    json_data = session.get("upload_results", [])
+    export_format = request.args.get("format", "xlsx")
+    if export_format not in EXPORT_FORMATS:
+        flash(f"Unsupported export format: {export_format}", "error")
+        return redirect(url_for("show_results"))
 
-    if not json_data:
+    batch_id = session.get("upload_batch_id")
+    revision = batch_id and upload_batches.get_revision(batch_id, session["user_id"])
+    if not revision:
         flash("No data available to download", "error")
         return redirect(url_for("show_results"))
 
-    # Create a DataFrame from the JSON data
-    rows = []
-    for entry in json_data:
-        row = {
-            "Roll Number": entry.get("roll_number", ""),
-        }
-
-        # Add question marks
-        for q_num in range(1, 7):
-            q_key = f"Q{q_num}"
-            if q_key in entry.get("questions", {}):
-                q_data = entry["questions"][q_key]
-                row[f"{q_key}a"] = q_data.get("a", 0)
-                row[f"{q_key}b"] = q_data.get("b", 0)
-                row[f"{q_key}c"] = q_data.get("c", 0)
-                row[f"{q_key}d"] = q_data.get("d", 0)
-            else:
-                row[f"{q_key}a"] = 0
-                row[f"{q_key}b"] = 0
-                row[f"{q_key}c"] = 0
-                row[f"{q_key}d"] = 0
-
-        row["Total"] = entry.get("total_marks", 0)
-        rows.append(row)
-
-    df = pd.DataFrame(rows)
+    etag = make_etag(request.path, export_format, batch_id, revision)
+    cached = not_modified(etag)
+    if cached:
+        return cached
 
-    # Create Excel file
-    excel_file = os.path.join(app.config["UPLOAD_FOLDER"], "results.xlsx")
-    df.to_excel(excel_file, index=False)
+    json_data = upload_batches.load(batch_id, session["user_id"])
+    if not json_data:
+        flash("No data available to download", "error")
+        return redirect(url_for("show_results"))
 
-    # Return the file for download
-    return send_file(excel_file, as_attachment=True)
+    rows = (
+        [roll_number, *marks, total_marks]
+        for roll_number, total_marks, marks in matrix_from_results(
+            json_data
+        ).iter_rows()
+    )
+    try:
+        response = send_export(
+            ["Roll Number", *MARK_COLUMNS, "Total"], rows, export_format, "results"
+        )
+        return with_cache_headers(response, etag)
+    except RuntimeError as e:
+        flash(str(e), "error")
+        return redirect(url_for("show_results"))
 
 
 @app.route("/marks-analysis")
@@ -719,112 +1083,12 @@ def marks_analysis():
         flash("Unauthorized access", "error")
         return redirect(url_for("index"))
 
-    with db.get_connection() as conn:
-        cursor = conn.cursor()
-
-        # Get all classes from the classes table
-        cursor.execute(
-            """
-            SELECT DISTINCT c.year, c.academic_year 
-            FROM classes c
-            ORDER BY c.academic_year DESC, c.year
-        """
-        )
-        class_years = [f"{row[0]} ({row[1]})" for row in cursor.fetchall()]
-
-        # Get all subjects from the subjects table
-        cursor.execute(
-            """
-            SELECT DISTINCT s.name 
-            FROM subjects s
-            JOIN classes c ON s.class_id = c.id
-            ORDER BY s.name
-        """
-        )
-        all_subjects = [row[0] for row in cursor.fetchall()]
-
-    with db_results.get_connection() as conn:
-        cursor = conn.cursor()
-
-        # Get all unique class years from results
-        cursor.execute(
-            """
-            SELECT DISTINCT class_year 
-            FROM students_results 
-            ORDER BY class_year
-        """
-        )
-        result_years = [row[0] for row in cursor.fetchall()]
-
-        # Get all unique subjects from results
-        cursor.execute(
-            """
-            SELECT DISTINCT subject 
-            FROM students_results 
-            ORDER BY subject
-        """
-        )
-        result_subjects = [row[0] for row in cursor.fetchall()]
-
-        # Get all unique exam types
-        cursor.execute(
-            """
-            SELECT DISTINCT exam_type 
-            FROM students_results 
-            ORDER BY exam_type
-        """
-        )
-        exam_types = [row[0] for row in cursor.fetchall()]
-
-        # Get summary statistics for each class and subject
-        cursor.execute(
-            """
-            SELECT 
-                class_year,
-                subject,
-                exam_type,
-                COUNT(*) as total_students,
-                AVG(total_marks) as avg_marks,
-                MAX(total_marks) as max_marks,
-                MIN(total_marks) as min_marks,
-                COUNT(CASE WHEN total_marks >= 20 THEN 1 END) as passed_count
-            FROM students_results
-            GROUP BY class_year, subject, exam_type
-            ORDER BY class_year, subject, exam_type
-        """
-        )
-
-        class_stats = {}
-        for row in cursor.fetchall():
-            if row[0] not in class_stats:
-                class_stats[row[0]] = {}
-            if row[1] not in class_stats[row[0]]:
-                class_stats[row[0]][row[1]] = {}
-
-            total_students = row[3]
-            class_stats[row[0]][row[1]][row[2]] = {
-                "total_students": total_students,
-                "avg_marks": round(row[4], 2) if row[4] else 0,
-                "max_marks": row[5],
-                "min_marks": row[6],
-                "pass_percentage": (
-                    round((row[7] / total_students * 100), 2)
-                    if total_students > 0
-                    else 0
-                ),
-            }
-
-    # Combine years and subjects from both databases
-    years = sorted(set(class_years + result_years))
-    subjects = sorted(set(all_subjects + result_subjects))
+    overview = db_results.get_marks_overview()
 
     return render_template(
         "marks_analysis.html",
         teacher_name=session.get("full_name"),
-        years=years,
-        subjects=subjects,
-        exam_types=exam_types,
-        class_stats=class_stats,
+        **overview,
     )
 
 
@@ -835,69 +1099,62 @@ def view_marks():
         flash("Unauthorized access", "error")
         return redirect(url_for("index"))
 
-    # Get all years and exam types for the dropdowns
-    with db_results.get_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT DISTINCT class_year FROM students_results ORDER BY class_year"
-        )
-        years = [row[0] for row in cursor.fetchall()]
-
-        cursor.execute(
-            "SELECT DISTINCT exam_type FROM students_results ORDER BY exam_type"
-        )
-        exam_types = [row[0] for row in cursor.fetchall()]
-
-        print(f"Years: {years}")
-        print(f"Exam Types: {exam_types}")
-
-    return render_template("view_marks.html", years=years, exam_types=exam_types)
+    catalog = db_results.get_catalog()
+    return render_template(
+        "view_marks.html", years=catalog["years"], exam_types=catalog["exam_types"]
+    )
 
 
 @app.route("/api/view-marks")
 @login_required
 def get_marks():
+    """Return a cohort's marks one keyset page at a time.
+
+    ``limit`` roll numbers after the ``after`` cursor are returned with the
+    cursor of the next page; ``format=ndjson`` instead streams every
+    record as one JSON line.
+    """
     year = request.args.get("year")
     subject = request.args.get("subject")
     exam_type = request.args.get("examType")
+    after = request.args.get("after")
+    output_format = request.args.get("format", "json")
+    try:
+        limit = min(max(int(request.args.get("limit", VIEW_MARKS_PAGE_SIZE)), 1), 1000)
+    except ValueError:
+        return jsonify({"error": "Invalid limit"}), 400
+
+    etag = cohort_etag(year, subject, exam_type, output_format, after, limit)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    if output_format == "ndjson":
+
+        def generate():
+            rows = db_results.iter_mark_rows(year, subject, exam_type)
+            for matrix in iter_mark_matrices(rows):
+                yield "".join(
+                    json.dumps(record) + "\n" for record in matrix.to_records(subject)
+                )
 
-    with db_results.get_connection() as conn:
-        cursor = conn.cursor()
-
-        # Get marks with question details
-        cursor.execute(
-            """
-            SELECT sr.roll_number, sr.subject, sr.total_marks,
-                   qm.question_number, qm.part_a, qm.part_b, qm.part_c, qm.part_d
-            FROM students_results sr
-            LEFT JOIN question_marks qm ON sr.id = qm.result_id
-            WHERE sr.class_year = ? AND sr.subject = ? AND sr.exam_type = ?
-            ORDER BY sr.roll_number, qm.question_number
-        """,
-            (year, subject, exam_type),
+        response = Response(
+            stream_with_context(generate()), mimetype="application/x-ndjson"
         )
+        return with_cache_headers(response, etag)
 
-        results = {}
-        for row in cursor.fetchall():
-            roll_number = row[0]
-            if roll_number not in results:
-                results[roll_number] = {
-                    "roll_number": roll_number,
-                    "subject": row[1],
-                    "total_marks": row[2],
-                    "questions": {},
-                }
-
-            if row[3]:  # if there are question details
-                q_num = row[3]
-                results[roll_number]["questions"][f"Q{q_num}"] = {
-                    "a": row[4],
-                    "b": row[5],
-                    "c": row[6],
-                    "d": row[7],
-                }
-
-        return jsonify(list(results.values()))
+    rows, next_cursor = db_results.get_mark_rows_page(
+        year, subject, exam_type, after, limit
+    )
+    matrix = build_mark_matrix(rows)
+    response = jsonify(
+        {
+            "marks": matrix.to_records(subject),
+            "next_cursor": next_cursor,
+            "limit": limit,
+        }
+    )
+    return with_cache_headers(response, etag)
 
 
 @app.route("/api/update-marks", methods=["POST"])
@@ -933,6 +1190,31 @@ def update_marks():
         return jsonify({"success": False, "message": str(e)}), 500
 
 
+@app.route("/api/update-marks/batch", methods=["POST"])
+@login_required
+def update_marks_batch():
+    if session.get("user_type") != "teacher":
+        return jsonify({"success": False, "message": "Unauthorized access"}), 403
+
+    try:
+        data = request.get_json() or {}
+        edits = data.get("edits")
+        if not isinstance(edits, list) or not edits:
+            return jsonify({"success": False, "message": "No edits provided"}), 400
+
+        results = db_results.update_results_batch(edits)
+        return jsonify(
+            {
+                "success": all(result["success"] for result in results),
+                "updated": sum(result["success"] for result in results),
+                "results": results,
+            }
+        )
+
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
+
 @app.route("/api/delete-marks", methods=["POST"])
 @login_required
 def delete_marks():
@@ -962,6 +1244,34 @@ def delete_marks():
         return jsonify({"success": False, "message": str(e)}), 500
 
 
+@app.route("/api/delete-marks/batch", methods=["POST"])
+@login_required
+def delete_marks_batch():
+    if session.get("user_type") != "teacher":
+        return jsonify({"success": False, "message": "Unauthorized access"}), 403
+
+    try:
+        data = request.get_json() or {}
+        deletions = data.get("deletions")
+        if not isinstance(deletions, list) or not deletions:
+            return (
+                jsonify({"success": False, "message": "No deletions provided"}),
+                400,
+            )
+
+        results = db_results.delete_results_batch(deletions)
+        return jsonify(
+            {
+                "success": all(result["success"] for result in results),
+                "deleted": sum(result["success"] for result in results),
+                "results": results,
+            }
+        )
+
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
+
 @app.route("/api/download-marks")
 @login_required
 def download_marks():
@@ -977,103 +1287,105 @@ def download_marks():
         flash("Missing required parameters", "error")
         return redirect(url_for("view_marks"))
 
-    with db_results.get_connection() as conn:
-        cursor = conn.cursor()
+    export_format = request.args.get("format", "xlsx")
+    if export_format not in EXPORT_FORMATS:
+        flash(f"Unsupported export format: {export_format}", "error")
+        return redirect(url_for("view_marks"))
 
-        # Get marks with question details
-        cursor.execute(
-            """
-            SELECT sr.roll_number, sr.subject, sr.total_marks,
-                   qm.question_number, qm.part_a, qm.part_b, qm.part_c, qm.part_d
-            FROM students_results sr
-            LEFT JOIN question_marks qm ON sr.id = qm.result_id
-            WHERE sr.class_year = ? AND sr.subject = ? AND sr.exam_type = ?
-            ORDER BY sr.roll_number, qm.question_number
-        """,
-            (year, subject, exam_type),
+    etag = cohort_etag(year, subject, exam_type, export_format)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    wide_rows = iter_wide_rows(db_results.iter_mark_rows(year, subject, exam_type))
+    first = next(wide_rows, None)
+    if first is None:
+        flash("No data available to download", "error")
+        return redirect(url_for("view_marks"))
+
+    def export_rows():
+        for roll_number, total_marks, marks in itertools.chain([first], wide_rows):
+            yield [roll_number, subject, total_marks, *marks]
+
+    try:
+        response = send_export(
+            ["Roll Number", "Subject", "Total Marks", *MARK_COLUMNS],
+            export_rows(),
+            export_format,
+            f"marks_{year}_{subject}_{exam_type}",
         )
+        return with_cache_headers(response, etag)
+    except RuntimeError as e:
+        flash(str(e), "error")
+        return redirect(url_for("view_marks"))
 
-        results = {}
-        for row in cursor.fetchall():
-            roll_number = row[0]
-            if roll_number not in results:
-                results[roll_number] = {
-                    "Roll Number": roll_number,
-                    "Subject": row[1],
-                    "Total Marks": row[2],
-                }
-                # Initialize all question parts with 0
-                for q_num in range(1, 7):
-                    results[roll_number][f"Q{q_num}a"] = 0
-                    results[roll_number][f"Q{q_num}b"] = 0
-                    results[roll_number][f"Q{q_num}c"] = 0
-                    results[roll_number][f"Q{q_num}d"] = 0
-
-            if row[3]:  # if there are question details
-                q_num = row[3]
-                results[roll_number][f"Q{q_num}a"] = row[4]
-                results[roll_number][f"Q{q_num}b"] = row[5]
-                results[roll_number][f"Q{q_num}c"] = row[6]
-                results[roll_number][f"Q{q_num}d"] = row[7]
 
-        if not results:
-            flash("No data available to download", "error")
-            return redirect(url_for("view_marks"))
-
-        # Create DataFrame and Excel file
-        df = pd.DataFrame(list(results.values()))
-
-        # Create a temporary file
-        temp_dir = tempfile.mkdtemp()
-        excel_path = os.path.join(temp_dir, f"marks_{year}_{subject}_{exam_type}.xlsx")
-
-        # Save to Excel with formatting
-        with pd.ExcelWriter(excel_path, engine="openpyxl") as writer:
-            df.to_excel(writer, index=False, sheet_name="Marks")
-
-            # Get the workbook and the worksheet
-            workbook = writer.book
-            worksheet = writer.sheets["Marks"]
-
-            # Format headers
-            for col in range(worksheet.max_column):
-                cell = worksheet.cell(row=1, column=col + 1)
-                cell.font = openpyxl.styles.Font(bold=True)
-                cell.fill = openpyxl.styles.PatternFill(
-                    start_color="8B5CF6", end_color="8B5CF6", fill_type="solid"
-                )
-                cell.font = openpyxl.styles.Font(color="FFFFFF", bold=True)
-
-            # Auto-adjust column widths
-            for column in worksheet.columns:
-                max_length = 0
-                column = [cell for cell in column]
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = max_length + 2
-                worksheet.column_dimensions[
-                    openpyxl.utils.get_column_letter(column[0].column)
-                ].width = adjusted_width
-
-        # Send file and clean up
-        try:
-            return send_file(
-                excel_path,
-                mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                as_attachment=True,
-                download_name=f"marks_{year}_{subject}_{exam_type}.xlsx",
+@app.route("/api/download-marks/bulk")
+@login_required
+def download_marks_bulk():
+    """Export every cohort matching the filters in one download.
+
+    ``layout=zip`` streams an archive with one file per cohort in ``format``
+    (csv or xlsx); ``layout=workbook`` returns one workbook with a sheet per
+    cohort. All cohorts come from a single ordered scan that is read ahead
+    on a background thread while the previous cohort is written.
+    """
+    if session.get("user_type") != "teacher":
+        flash("Unauthorized access", "error")
+        return redirect(url_for("index"))
+
+    layout = request.args.get("layout", "zip")
+    export_format = request.args.get("format", "csv")
+    if layout not in ("zip", "workbook") or export_format not in ("csv", "xlsx"):
+        flash("Unsupported bulk export layout or format", "error")
+        return redirect(url_for("view_marks"))
+
+    cohorts = iter_cohorts(
+        prefetch(
+            db_results.iter_cohort_mark_rows(
+                class_year=request.args.get("year"),
+                subject=request.args.get("subject"),
+                exam_type=request.args.get("examType"),
+                academic_year=request.args.get("academicYear"),
             )
-        finally:
-            # Clean up temp file in a separate thread to avoid blocking
-            def cleanup():
-                time.sleep(1)  # Wait a bit to ensure file is sent
-                shutil.rmtree(temp_dir, ignore_errors=True)
+        )
+    )
+    first = next(cohorts, None)
+    if first is None:
+        flash("No data available to download", "error")
+        return redirect(url_for("view_marks"))
 
-            threading.Thread(target=cleanup).start()
+    headers = ["Roll Number", "Subject", "Total Marks", *MARK_COLUMNS]
+
+    def cohort_rows(cohort, wide_rows):
+        for roll_number, total_marks, marks in wide_rows:
+            yield [roll_number, cohort[1], total_marks, *marks]
+
+    if layout == "workbook":
+        return send_file(
+            write_xlsx_sheets(
+                ("_".join(cohort), headers, cohort_rows(cohort, wide_rows))
+                for cohort, wide_rows in itertools.chain([first], cohorts)
+            ),
+            mimetype=EXPORT_FORMATS["xlsx"],
+            as_attachment=True,
+            download_name="marks_bulk.xlsx",
+        )
+
+    def entries():
+        for cohort, wide_rows in itertools.chain([first], cohorts):
+            name = secure_filename(f"marks_{'_'.join(cohort)}.{export_format}")
+            rows = cohort_rows(cohort, wide_rows)
+            if export_format == "csv":
+                yield name, (chunk.encode() for chunk in iter_csv(headers, rows))
+            else:
+                yield name, iter_file_chunks(write_xlsx(headers, rows))
+
+    return Response(
+        stream_with_context(iter_zip(entries())),
+        mimetype="application/zip",
+        headers={"Content-Disposition": "attachment; filename=marks_bulk.zip"},
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,219 @@
+"""Offline batch extraction of answer-sheet scans
+
+Extract a folder of scans into the uploads/*.json format, optionally saving
+the results as well, or load existing output files into the results store:
+
+    python batch.py extract scans/ --class FY --subject java --year 2023-2024
+    python batch.py extract scans/ --class FY --subject java --year 2023-2024 \\
+        --exam-type MID1 --load --format ndjson --processes
+    python batch.py load uploads/java_FY_2023-2024.json --exam-type MID1
+"""
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import groupby, islice
+
+from ingest import is_scan, process_scan, save_scanned_results
+
+OUTPUT_DIR = "uploads"
+# Scans extracted at once; extraction mostly waits on the model API
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", 4))
+# Records saved per save_results call when loading
+LOAD_BATCH_SIZE = 500
+
+
+def find_scans(scan_dir):
+    """Scan files under scan_dir, in path order"""
+    return sorted(
+        os.path.join(dirpath, filename)
+        for dirpath, _, filenames in os.walk(scan_dir)
+        for filename in filenames
+        if is_scan(filename)
+    )
+
+
+def _process_file(path):
+    try:
+        return process_scan(path), None
+    except Exception as e:
+        return [], str(e)
+
+
+def extract_records(paths, meta, workers=BATCH_WORKERS, processes=False, stats=None):
+    """Yield one record per extracted result, in scan order
+
+    Scans are extracted on a thread pool, or a process pool when processes
+    is set (PDF rendering is CPU bound). meta (class, subject, year) and
+    the scan's filename are added to every record.
+    """
+    stats = stats if stats is not None else {}
+    executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with executor(max_workers=workers) as pool:
+        for path, (results, error) in zip(paths, pool.map(_process_file, paths)):
+            stats["files"] = stats.get("files", 0) + 1
+            if error or not results:
+                stats["failed"] = stats.get("failed", 0) + 1
+                print(f"No results from {path}: {error or 'no valid data extracted'}")
+                continue
+            for result in results:
+                yield {**result, **meta, "filename": os.path.basename(path)}
+
+
+def read_records(path):
+    """Yield the records of a JSON array or NDJSON output file"""
+    with open(path, encoding="utf-8") as f:
+        start = f.read(1)
+        while start.isspace():
+            start = f.read(1)
+        f.seek(0)
+        if start == "[":
+            yield from json.load(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def write_records(records, path, output_format="json"):
+    """Write records to path as they arrive; returns how many were written
+
+    "json" writes the indented array of uploads/*.json, "ndjson" one
+    record per line. The file is written under a .part name and renamed
+    when complete.
+    """
+    temp_path = f"{path}.part"
+    count = 0
+    with open(temp_path, "w", encoding="utf-8") as f:
+        if output_format == "json":
+            f.write("[")
+        for record in records:
+            if output_format == "json":
+                f.write("," if count else "")
+                f.write("\n  " + json.dumps(record, indent=2).replace("\n", "\n  "))
+            else:
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+            count += 1
+        if output_format == "json":
+            f.write("\n]" if count else "]")
+    os.replace(temp_path, path)
+    return count
+
+
+def load_records(results_db, records, exam_type, defaults=None, stats=None):
+    """Save records to the results store in chunks, yielding them once saved
+
+    Each record's class, subject and year (academic year) pick its exam,
+    falling back to defaults. Roll numbers are snapped as on upload, so the
+    yielded records carry the saved roll numbers.
+    """
+    defaults = defaults or {}
+    stats = stats if stats is not None else {}
+    records = iter(records)
+
+    def cohort(record):
+        return tuple(
+            record.get(field) or defaults.get(field) or ""
+            for field in ("class", "subject", "year")
+        )
+
+    while True:
+        chunk = list(islice(records, LOAD_BATCH_SIZE))
+        if not chunk:
+            return
+        for key, group in groupby(sorted(chunk, key=cohort), key=cohort):
+            group = list(group)
+            if not all(key):
+                print(f"Skipping {len(group)} records without class/subject/year")
+                stats["skipped"] = stats.get("skipped", 0) + len(group)
+                continue
+            class_year, subject, academic_year = key
+            saved, roll_numbers = save_scanned_results(
+                results_db, group, class_year, subject, exam_type, academic_year
+            )
+            stats["saved"] = stats.get("saved", 0) + saved
+            stats["flagged"] = stats.get("flagged", 0) + len(roll_numbers["flagged"])
+            for check in roll_numbers["flagged"]:
+                print(f"Roll number to review: {check}")
+        yield from chunk
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__.splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="\n".join(__doc__.splitlines()[4:]),
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    extract = commands.add_parser("extract", help="extract a folder of scans")
+    extract.add_argument("scan_dir")
+    extract.add_argument("--class", dest="class_year", required=True)
+    extract.add_argument("--subject", required=True)
+    extract.add_argument("--year", required=True, help="academic year")
+    extract.add_argument("--exam-type", help="required with --load")
+    extract.add_argument("--output", help="default: uploads/<subject>_<class>_<year>")
+    extract.add_argument("--format", choices=("json", "ndjson"), default="json")
+    extract.add_argument("--workers", type=int)
+    extract.add_argument(
+        "--processes", action="store_true", help="extract in processes, not threads"
+    )
+    extract.add_argument(
+        "--load", action="store_true", help="also save the results to the database"
+    )
+
+    load = commands.add_parser("load", help="save output files to the database")
+    load.add_argument("files", nargs="+")
+    load.add_argument("--exam-type", required=True)
+    load.add_argument("--class", dest="class_year", help="for records without one")
+    load.add_argument("--subject", help="for records without one")
+    load.add_argument("--year", help="academic year, for records without one")
+
+    args = parser.parse_args()
+    if args.command == "extract" and args.load and not args.exam_type:
+        parser.error("--load requires --exam-type")
+
+    results_db = None
+    if args.command == "load" or args.load:
+        from database import ResultsDatabase
+
+        # Shares the app's store, so its tables must not be reset
+        results_db = ResultsDatabase(reset=False)
+
+    stats = {}
+    meta = {"class": args.class_year, "subject": args.subject, "year": args.year}
+    if args.command == "extract":
+        paths = find_scans(args.scan_dir)
+        output = args.output or os.path.join(
+            OUTPUT_DIR, f"{args.subject}_{args.class_year}_{args.year}.{args.format}"
+        )
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        print(f"Extracting {len(paths)} scans to {output}")
+
+        records = extract_records(
+            paths,
+            meta,
+            workers=args.workers
+            or (os.cpu_count() if args.processes else BATCH_WORKERS),
+            processes=args.processes,
+            stats=stats,
+        )
+        if results_db:
+            records = load_records(
+                results_db, records, args.exam_type, meta, stats=stats
+            )
+        stats["records"] = write_records(records, output, args.format)
+    else:
+        for path in args.files:
+            records = load_records(
+                results_db, read_records(path), args.exam_type, meta, stats=stats
+            )
+            stats["records"] = stats.get("records", 0) + sum(1 for _ in records)
+
+    print(f"Done: {stats}")
+
+
+if __name__ == "__main__":
+    main()
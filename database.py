@@ -1,7 +1,20 @@
 import sqlite3
-from werkzeug.security import generate_password_hash, check_password_hash
+from passwords import hasher, HashingBusy
+from maintenance import ensure_incremental_vacuum
+from pivot import PARTS, QUESTION_COUNT, pack_marks, unpack_marks
+from ranking import RankIndex
+from readpool import PooledConnection, ReadPool
+from rollmatch import RollNumberIndex
+from shards import ShardRouter
+from writer import WriteQueue, WriterBusy
 from datetime import datetime
+import json
+import math
 import os
+import secrets
+import threading
+import time
+import zlib
 
 if not os.path.exists("./database"):
     os.makedirs("./database")
@@ -80,13 +93,15 @@ def register_student(student_id, full_name, department, password):
     if conn:
         try:
             c = conn.cursor()
-            hashed_password = generate_password_hash(password)
+            hashed_password = hasher.hash(password)
             c.execute(
                 "INSERT INTO students (id, full_name, department, password) VALUES (?, ?, ?, ?)",
                 (student_id, full_name, department, hashed_password),
             )
             conn.commit()
             return True, "Student registration successful!"
+        except HashingBusy:
+            return False, "Server is busy, please try again"
         except sqlite3.Error as e:
             return False, f"Registration failed: {str(e)}"
         finally:
@@ -104,13 +119,15 @@ def register_teacher(teacher_id, full_name, department, specialization, password
     if conn:
         try:
             c = conn.cursor()
-            hashed_password = generate_password_hash(password)
+            hashed_password = hasher.hash(password)
             c.execute(
                 "INSERT INTO teachers (id, full_name, department, specialization, password) VALUES (?, ?, ?, ?, ?)",
                 (teacher_id, full_name, department, specialization, hashed_password),
             )
             conn.commit()
             return True, "Teacher registration successful!"
+        except HashingBusy:
+            return False, "Server is busy, please try again"
         except sqlite3.Error as e:
             return False, f"Registration failed: {str(e)}"
         finally:
@@ -118,6 +135,112 @@ def register_teacher(teacher_id, full_name, department, specialization, password
     return False, "Database connection error"
 
 
+def _rehash_password(conn, table, user_id, password):
+    """Upgrade a stored hash to the configured algorithm and cost"""
+    try:
+        conn.execute(
+            f"UPDATE {table} SET password = ? WHERE id = ?",
+            (hasher.hash(password), user_id),
+        )
+        conn.commit()
+        hasher.record_rehash()
+    except (sqlite3.Error, HashingBusy) as e:
+        # The login itself succeeded; retry the upgrade next time
+        print(f"Password rehash failed for {user_id}: {e}")
+
+
+def import_students(rows):
+    """Register many students in one transaction
+
+    rows are dicts with id, full_name, department and password. IDs are
+    checked against both user tables with one set-based query, passwords
+    are hashed in parallel, and all valid rows are inserted together.
+    Returns one {"row", "id", "success", "message"} report per input row.
+    """
+    reports = []
+    seen = set()
+    valid = []
+    for row_number, row in enumerate(rows, start=1):
+        student_id = (row.get("id") or "").strip()
+        report = {"row": row_number, "id": student_id, "success": False}
+        reports.append(report)
+
+        if not all(
+            [
+                student_id,
+                row.get("full_name"),
+                row.get("department"),
+                row.get("password"),
+            ]
+        ):
+            report["message"] = "All fields are required"
+        elif student_id in seen:
+            report["message"] = "Duplicate ID in file"
+        else:
+            seen.add(student_id)
+            valid.append((report, row))
+
+    conn = create_connection()
+    if not conn:
+        for report in reports:
+            report.setdefault("message", "Database connection error")
+        return reports
+
+    try:
+        c = conn.cursor()
+        c.execute("CREATE TEMP TABLE IF NOT EXISTS roster_ids (id TEXT PRIMARY KEY)")
+        c.execute("DELETE FROM roster_ids")
+        c.executemany(
+            "INSERT INTO roster_ids VALUES (?)",
+            [(report["id"],) for report, _ in valid],
+        )
+        c.execute(
+            """
+            SELECT id, 'Student ID already exists' FROM students
+            WHERE id IN (SELECT id FROM roster_ids)
+            UNION ALL
+            SELECT id, 'Teacher ID already exists' FROM teachers
+            WHERE id IN (SELECT id FROM roster_ids)
+        """
+        )
+        existing = dict(c.fetchall())
+
+        to_insert = []
+        for report, row in valid:
+            if report["id"] in existing:
+                report["message"] = existing[report["id"]]
+            else:
+                to_insert.append((report, row))
+
+        hashes = hasher.hash_many([row["password"] for _, row in to_insert])
+        c.executemany(
+            "INSERT INTO students (id, full_name, department, password) VALUES (?, ?, ?, ?)",
+            [
+                (
+                    report["id"],
+                    row["full_name"].strip(),
+                    row["department"].strip(),
+                    hashed,
+                )
+                for (report, row), hashed in zip(to_insert, hashes)
+            ],
+        )
+        conn.commit()
+        for report, _ in to_insert:
+            report["success"] = True
+            report["message"] = "Student registered"
+    except (sqlite3.Error, HashingBusy) as e:
+        conn.rollback()
+        for report in reports:
+            if report["success"] or "message" not in report:
+                report["success"] = False
+                report["message"] = f"Import rolled back: {e}"
+    finally:
+        conn.close()
+
+    return reports
+
+
 def verify_student(student_id, password):
     conn = create_connection()
     if conn:
@@ -129,13 +252,18 @@ def verify_student(student_id, password):
             if not student:
                 return False, "Invalid Student ID"
 
-            if check_password_hash(student[3], password):
+            valid, needs_rehash = hasher.verify(student[3], password)
+            if valid:
+                if needs_rehash:
+                    _rehash_password(conn, "students", student[0], password)
                 return True, {
                     "id": student[0],
                     "full_name": student[1],
                     "department": student[2],
                 }
             return False, "Invalid Password"
+        except HashingBusy:
+            return False, "Server is busy, please try again"
         finally:
             conn.close()
     return False, "Database connection error"
@@ -152,13 +280,18 @@ def verify_teacher(teacher_id, password):
             if not teacher:
                 return False, "Invalid Teacher ID"
 
-            if check_password_hash(teacher[4], password):
+            valid, needs_rehash = hasher.verify(teacher[4], password)
+            if valid:
+                if needs_rehash:
+                    _rehash_password(conn, "teachers", teacher[0], password)
                 return True, {
                     "id": teacher[0],
                     "full_name": teacher[1],
                     "department": teacher[2],
                 }
             return False, "Invalid Password"
+        except HashingBusy:
+            return False, "Server is busy, please try again"
         finally:
             conn.close()
     return False, "Database connection error"
@@ -346,21 +479,167 @@ class Database:
             return None
 
 
+# Dimensions of the results rollup cube, finest grain first
+CUBE_DIMENSIONS = ("department", "academic_year", "class_year", "subject", "exam_type")
+
+# Mark bands shared by the cube and the cohort distribution
+MARK_BANDS = (
+    ("0-8", 0, 9),
+    ("9-16", 9, 17),
+    ("17-24", 17, 25),
+    ("25-32", 25, 33),
+    ("33-40", 33, None),
+)
+
+PASS_MARK = 20
+
+# Fields identifying a result in the update/delete APIs
+RESULT_KEY_FIELDS = ("roll_number", "class_year", "subject", "exam_type")
+
+# Opt in to storing a result's part marks in students_results.packed_marks
+# instead of six question_marks rows whenever they fit (see pivot.pack_marks)
+PACKED_MARKS = os.getenv("RESULTS_PACKED_MARKS", "0") == "1"
+
+# Question numbers as a table, for expanding packed marks into rows
+QUESTION_NUMBERS_SQL = "(SELECT column1 AS question_number FROM (VALUES {}))".format(
+    ", ".join(f"({q})" for q in range(1, QUESTION_COUNT + 1))
+)
+
+
+def unpacked_part_sql(blob, question, part):
+    """SQL expression decoding one part mark from a packed_marks column
+
+    question is an SQL expression for the question number and part an index
+    into PARTS; each part mark is one hex digit of the blob. NULL when the
+    blob is NULL.
+    """
+    position = f"({question}) * {len(PARTS)} - {len(PARTS) - 1 - part}"
+    return (
+        "CAST(instr('0123456789ABCDEF', "
+        f"substr(nullif(hex({blob}), ''), {position}, 1)) - 1 AS REAL)"
+    )
+
+
+def part_columns_sql(marks, blob, question):
+    """part_a..part_d from a question_marks alias, else from packed marks"""
+    return ", ".join(
+        f"COALESCE({marks}.part_{part}, {unpacked_part_sql(blob, question, index)})"
+        f" AS part_{part}"
+        for index, part in enumerate(PARTS)
+    )
+
+
+# How long a published student summary is served from memory before it is
+# re-read, and how many summaries are kept
+SUMMARY_CACHE_TTL = 60
+SUMMARY_CACHE_SIZE = 4096
+
+# How long the results catalog is served from memory; local writes clear it
+# at once, the TTL bounds how stale it gets after another process writes
+CATALOG_CACHE_TTL = 30
+
+
 class ResultsDatabase:
-    def __init__(self, db_file="./database/exam_results.db"):
+    def __init__(
+        self,
+        db_file="./database/exam_results.db",
+        users_db_file="./database/education.db",
+        analysis_db_file="./database/exam_analysis.db",
+        reset=True,
+    ):
         self.db_file = db_file
-        self.init_db()
+        self.users_db_file = users_db_file
+        self.analysis_db_file = analysis_db_file
+        self.shards = ShardRouter(db_file)
+        self.readers = ReadPool(self._open_reader, is_current=self._reader_is_current)
+        self._summary_cache = {}
+        self._summary_lock = threading.Lock()
+        self.ranks = RankIndex()
+        # Registered students, for snapping misread roll numbers on upload
+        self.roll_numbers = RollNumberIndex(users_db_file)
+        self._catalog_cache = {}
+        # All writes to the results go through one thread and connection.
+        # It has no stores attached: BEGIN IMMEDIATE would also take their
+        # write locks and hold off student registration and roster imports.
+        self.writer = WriteQueue(self.get_connection)
+        # Other processes sharing the store (the watch-folder worker) pass
+        # reset=False so they do not drop the app's tables
+        self.init_db(reset)
 
     def get_connection(self):
         return sqlite3.connect(self.db_file)
 
-    def init_db(self):
+    def get_unified_connection(self):
+        """Connection to the results with the other stores attached
+
+        education.db is attached as ``users`` and exam_analysis.db as
+        ``analysis``, so reports can join marks to students, classes and
+        subjects in a single query.
+        """
+        conn = self.get_connection()
+        conn.execute("ATTACH DATABASE ? AS users", (self.users_db_file,))
+        conn.execute("ATTACH DATABASE ? AS analysis", (self.analysis_db_file,))
+        return conn
+
+    def _open_reader(self):
+        """Read-only unified connection that also sees every frozen year
+
+        Archived years are attached read-only and students_results /
+        question_marks resolve to views over the live tables and all
+        archives.
+        """
+        conn = sqlite3.connect(
+            f"file:{os.path.abspath(self.db_file)}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+            isolation_level=None,
+            factory=PooledConnection,
+        )
+        for schema, path in (
+            ("users", self.users_db_file),
+            ("analysis", self.analysis_db_file),
+        ):
+            conn.execute(
+                f"ATTACH DATABASE ? AS {schema}",
+                (f"file:{os.path.abspath(path)}?mode=ro",),
+            )
+        conn.shard_years = tuple(self.shards.frozen_years(conn))
+        return self.shards.attach(conn)
+
+    def _reader_is_current(self, conn):
+        """Whether a pooled reader still has the current set of archives"""
+        return tuple(self.shards.frozen_years(conn)) == conn.shard_years
+
+    def read_connection(self):
+        """Borrow a pooled read-only connection for a ``with`` block
+
+        The block sees one consistent snapshot and never blocks, or is
+        blocked by, the writer.
+        """
+        return self.readers.connection()
+
+    def init_db(self, reset=True):
         with self.get_connection() as conn:
             cursor = conn.cursor()
 
+            # Deleted results leave free pages for the maintenance thread to
+            # release with incremental_vacuum
+            ensure_incremental_vacuum(conn)
+
+            # WAL lets the read pool keep serving snapshots while the writer
+            # commits; the setting is stored in the database file
+            cursor.execute("PRAGMA journal_mode = WAL")
+
             # Drop existing tables if they exist
-            cursor.execute("DROP TABLE IF EXISTS question_marks")
-            cursor.execute("DROP TABLE IF EXISTS students_results")
+            if reset:
+                cursor.execute("DROP VIEW IF EXISTS all_question_marks")
+                cursor.execute("DROP TABLE IF EXISTS results_shards")
+                cursor.execute("DROP TABLE IF EXISTS student_summaries")
+                cursor.execute("DROP TABLE IF EXISTS results_catalog")
+                cursor.execute("DROP TABLE IF EXISTS results_cube")
+                cursor.execute("DROP TABLE IF EXISTS cohort_versions")
+                cursor.execute("DROP TABLE IF EXISTS question_marks")
+                cursor.execute("DROP TABLE IF EXISTS students_results")
 
             # Create tables for storing results
             cursor.execute(
@@ -373,6 +652,7 @@ class ResultsDatabase:
                     exam_type TEXT NOT NULL,
                     academic_year TEXT NOT NULL,
                     total_marks FLOAT NOT NULL,
+                    packed_marks BLOB,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     UNIQUE(roll_number, class_year, subject, exam_type, academic_year)
                 )
@@ -395,103 +675,180 @@ class ResultsDatabase:
             """
             )
 
+            # Every result's question marks as rows, whether stored in
+            # question_marks or packed on the result, for ad-hoc SQL
+            parts = ", ".join(
+                f"{unpacked_part_sql('sr.packed_marks', 'q.question_number', index)}"
+                f" AS part_{part}"
+                for index, part in enumerate(PARTS)
+            )
+            cursor.execute(
+                f"""
+                CREATE VIEW IF NOT EXISTS all_question_marks AS
+                SELECT id, result_id, question_number,
+                       part_a, part_b, part_c, part_d
+                FROM question_marks
+                UNION ALL
+                SELECT NULL, sr.id, q.question_number, {parts}
+                FROM students_results sr
+                CROSS JOIN {QUESTION_NUMBERS_SQL} q
+                WHERE sr.packed_marks IS NOT NULL
+            """
+            )
+
+            # Cohort lookups (and MID1/MID2 pairing) walk this index in
+            # roll number order instead of scanning the whole table
+            cursor.execute(
+                """
+                CREATE INDEX IF NOT EXISTS idx_results_cohort
+                ON students_results (class_year, subject, exam_type, roll_number)
+            """
+            )
+
+            # Joins from the students table land on a student's results here
+            cursor.execute(
+                """
+                CREATE INDEX IF NOT EXISTS idx_results_roll
+                ON students_results (roll_number)
+            """
+            )
+
+            # Bumped by every write to a cohort so in-memory caches of its
+            # marks know when they are stale
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS cohort_versions (
+                    class_year TEXT NOT NULL,
+                    subject TEXT NOT NULL,
+                    exam_type TEXT NOT NULL,
+                    version INTEGER NOT NULL DEFAULT 0,
+                    changed_at TEXT NOT NULL
+                        DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+                    PRIMARY KEY (class_year, subject, exam_type)
+                )
+            """
+            )
+
+            # Rollup cube: one precomputed cell per
+            # department x academic_year x class_year x subject x exam_type.
+            # Measures are additive so coarser cells are sums of finer ones.
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS results_cube (
+                    department TEXT NOT NULL,
+                    academic_year TEXT NOT NULL,
+                    class_year TEXT NOT NULL,
+                    subject TEXT NOT NULL,
+                    exam_type TEXT NOT NULL,
+                    student_count INTEGER NOT NULL,
+                    marks_sum FLOAT NOT NULL,
+                    marks_sq_sum FLOAT NOT NULL,
+                    min_marks FLOAT,
+                    max_marks FLOAT,
+                    passed_count INTEGER NOT NULL,
+                    band_0_8 INTEGER NOT NULL,
+                    band_9_16 INTEGER NOT NULL,
+                    band_17_24 INTEGER NOT NULL,
+                    band_25_32 INTEGER NOT NULL,
+                    band_33_40 INTEGER NOT NULL,
+                    refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (class_year, subject, exam_type, academic_year, department)
+                )
+            """
+            )
+
+            # Known (class_year, subject, exam_type, academic_year)
+            # combinations, kept alongside the cube for the dropdowns
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS results_catalog (
+                    class_year TEXT NOT NULL,
+                    subject TEXT NOT NULL,
+                    exam_type TEXT NOT NULL,
+                    academic_year TEXT NOT NULL,
+                    result_count INTEGER NOT NULL,
+                    PRIMARY KEY (class_year, subject, exam_type, academic_year)
+                )
+            """
+            )
+
+            # Academic years moved out into frozen archives
+            self.shards.create_registry(cursor)
+
+            # Per-student results page, rendered when results are published
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS student_summaries (
+                    roll_number TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    published_at TIMESTAMP NOT NULL
+                )
+            """
+            )
+
+    def get_saved_roll_numbers(self, class_year, subject, exam_type, academic_year):
+        """Roll numbers that already have a result for this exam"""
+        with self.read_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT roll_number FROM students_results
+                WHERE class_year = ? AND subject = ? AND exam_type = ?
+                  AND academic_year = ?
+            """,
+                (class_year, subject, exam_type, academic_year),
+            )
+            return {row[0] for row in cursor.fetchall()}
+
     def save_results(self, results, class_year, subject, exam_type, academic_year):
         """Save results to database"""
         successful_saves = 0
         errors = []
 
+        if academic_year in self.shards.frozen_years():
+            print(f"Academic year {academic_year} is archived, not saving results")
+            return 0
+
+        # Every entry is its own writer job, so one bad entry is rolled back
+        # alone while the rest share the writer's batched transactions
+        pending = []
         for entry in results:
+            roll_number = entry.get("roll_number")
+            if not roll_number:
+                print("Missing roll number, skipping entry")
+                continue
             try:
-                with self.get_connection() as conn:
-                    cursor = conn.cursor()
-
-                    roll_number = entry.get("roll_number")
-                    if not roll_number:
-                        print("Missing roll number, skipping entry")
-                        continue
-
-                    # First check if this exact combination exists
-                    cursor.execute(
-                        """
-                        SELECT id FROM students_results 
-                        WHERE roll_number = ? AND class_year = ? AND subject = ? AND exam_type = ? AND academic_year = ?
-                    """,
-                        (roll_number, class_year, subject, exam_type, academic_year),
-                    )
-
-                    existing_record = cursor.fetchone()
-                    total_marks = entry.get("total_marks", 0)
-                    questions = entry.get("questions", {})
-
-                    if existing_record:
-                        # Update existing record
-                        result_id = existing_record[0]
-                        cursor.execute(
-                            """
-                            UPDATE students_results 
-                            SET total_marks = ?
-                            WHERE id = ?
-                        """,
-                            (total_marks, result_id),
-                        )
-
-                        # Delete existing question marks
-                        cursor.execute(
-                            "DELETE FROM question_marks WHERE result_id = ?",
-                            (result_id,),
-                        )
-                    else:
-                        # Insert new record
-                        cursor.execute(
-                            """
-                            INSERT INTO students_results 
-                            (roll_number, class_year, subject, exam_type, academic_year, total_marks)
-                            VALUES (?, ?, ?, ?, ?, ?)
-                        """,
-                            (
-                                roll_number,
-                                class_year,
-                                subject,
-                                exam_type,
-                                academic_year,
-                                total_marks,
-                            ),
-                        )
-                        result_id = cursor.lastrowid
-
-                    # Insert question marks
-                    for q_num in range(1, 7):
-                        q_key = f"Q{q_num}"
-                        q_data = questions.get(q_key, {"a": 0, "b": 0, "c": 0, "d": 0})
-
-                        cursor.execute(
-                            """
-                            INSERT INTO question_marks 
-                            (result_id, question_number, part_a, part_b, part_c, part_d)
-                            VALUES (?, ?, ?, ?, ?, ?)
-                        """,
-                            (
-                                result_id,
-                                q_num,
-                                q_data.get("a", 0),
-                                q_data.get("b", 0),
-                                q_data.get("c", 0),
-                                q_data.get("d", 0),
-                            ),
-                        )
-
-                    conn.commit()
-                    successful_saves += 1
-                    print(
-                        f"Successfully processed result for roll number {roll_number}"
+                future = self.writer.submit(
+                    lambda cursor, entry=entry: self._save_entry(
+                        cursor, entry, class_year, subject, exam_type, academic_year
                     )
+                )
+            except WriterBusy as e:
+                errors.append(f"Error processing result for {roll_number}: {str(e)}")
+                continue
+            pending.append((entry, future))
 
+        for entry, future in pending:
+            roll_number = entry["roll_number"]
+            try:
+                stamp = future.result()
             except Exception as e:
-                error_msg = f"Error processing result for {entry.get('roll_number', 'Unknown')}: {str(e)}"
+                error_msg = f"Error processing result for {roll_number}: {str(e)}"
                 print(error_msg)
                 errors.append(error_msg)
                 continue
 
+            self.ranks.apply(
+                (class_year, subject, exam_type),
+                stamp,
+                [(roll_number, academic_year, entry.get("total_marks", 0))],
+            )
+            successful_saves += 1
+            print(f"Successfully processed result for roll number {roll_number}")
+
+        if successful_saves:
+            self.refresh_cube([(class_year, subject, exam_type, academic_year)])
+
         print(f"Total successful saves: {successful_saves}")
         if errors:
             print("Errors encountered:")
@@ -500,9 +857,187 @@ class ResultsDatabase:
 
         return successful_saves
 
+    def _save_entry(self, cursor, entry, class_year, subject, exam_type, academic_year):
+        """Writer job: insert or replace one student's result"""
+        roll_number = entry["roll_number"]
+
+        # First check if this exact combination exists
+        cursor.execute(
+            """
+            SELECT id FROM students_results 
+            WHERE roll_number = ? AND class_year = ? AND subject = ? AND exam_type = ? AND academic_year = ?
+        """,
+            (roll_number, class_year, subject, exam_type, academic_year),
+        )
+
+        existing_record = cursor.fetchone()
+        total_marks = entry.get("total_marks", 0)
+        questions = entry.get("questions", {})
+        packed_marks = self._pack_questions(questions)
+
+        if existing_record:
+            # Update existing record
+            result_id = existing_record[0]
+            cursor.execute(
+                """
+                UPDATE students_results 
+                SET total_marks = ?, packed_marks = ?
+                WHERE id = ?
+            """,
+                (total_marks, packed_marks, result_id),
+            )
+
+            # Delete existing question marks
+            cursor.execute(
+                "DELETE FROM question_marks WHERE result_id = ?",
+                (result_id,),
+            )
+        else:
+            # Insert new record
+            cursor.execute(
+                """
+                INSERT INTO students_results 
+                (roll_number, class_year, subject, exam_type, academic_year,
+                 total_marks, packed_marks)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+                (
+                    roll_number,
+                    class_year,
+                    subject,
+                    exam_type,
+                    academic_year,
+                    total_marks,
+                    packed_marks,
+                ),
+            )
+            result_id = cursor.lastrowid
+
+        # Packed results need no question rows
+        if packed_marks is not None:
+            return self._bump_version(cursor, class_year, subject, exam_type)
+
+        # Insert question marks
+        for q_num in range(1, 7):
+            q_key = f"Q{q_num}"
+            q_data = questions.get(q_key, {"a": 0, "b": 0, "c": 0, "d": 0})
+
+            cursor.execute(
+                """
+                INSERT INTO question_marks 
+                (result_id, question_number, part_a, part_b, part_c, part_d)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """,
+                (
+                    result_id,
+                    q_num,
+                    q_data.get("a", 0),
+                    q_data.get("b", 0),
+                    q_data.get("c", 0),
+                    q_data.get("d", 0),
+                ),
+            )
+
+        return self._bump_version(cursor, class_year, subject, exam_type)
+
+    @staticmethod
+    def _pack_questions(questions):
+        """packed_marks for a result's questions, or None to store rows"""
+        if not PACKED_MARKS:
+            return None
+        marks = [
+            [questions.get(f"Q{q_num}", {}).get(part, 0) for part in PARTS]
+            for q_num in range(1, QUESTION_COUNT + 1)
+        ]
+        try:
+            return pack_marks(marks)[0]
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _parse_question_marks(questions):
+        """(part_a, part_b, part_c, part_d, question_number) rows of an edit
+
+        Marks are coerced to numbers, so packed and stored results accept
+        the same input. Raises ValueError for marks that are not numbers.
+        """
+        try:
+            rows = [
+                (*(float(marks[part]) for part in PARTS), int(q_num[1:]))
+                for q_num, marks in questions.items()
+            ]
+        except (AttributeError, KeyError, TypeError, ValueError):
+            raise ValueError("Invalid question marks")
+        if not all(math.isfinite(mark) for row in rows for mark in row[:-1]):
+            raise ValueError("Invalid question marks")
+        return rows
+
+    @staticmethod
+    def _parse_total_marks(total_marks):
+        """An edit's total marks as a number; raises ValueError if it is not one"""
+        try:
+            total_marks = float(total_marks)
+        except (TypeError, ValueError):
+            raise ValueError("Invalid total marks")
+        if not math.isfinite(total_marks):
+            raise ValueError("Invalid total marks")
+        return total_marks
+
+    def _update_question_marks(self, cursor, part_rows):
+        """Writer helper: apply (part_a, part_b, part_c, part_d, result_id,
+        question_number) updates to stored or packed marks
+
+        Packed results are decoded, updated and packed again; one whose new
+        marks no longer fit is moved into question_marks rows.
+        """
+        by_result = {}
+        for row in part_rows:
+            by_result.setdefault(row[4], []).append(row)
+
+        stored_rows = []
+        for result_id, updates in by_result.items():
+            cursor.execute(
+                "SELECT packed_marks FROM students_results WHERE id = ?", (result_id,)
+            )
+            found = cursor.fetchone()
+            if not found or found[0] is None:
+                stored_rows.extend(updates)
+                continue
+
+            marks = unpack_marks([found[0]])
+            for *parts, _, q_num in updates:
+                if 1 <= q_num <= QUESTION_COUNT:
+                    marks[0, q_num - 1] = parts
+            packed_marks = pack_marks(marks)[0] if PACKED_MARKS else None
+            cursor.execute(
+                "UPDATE students_results SET packed_marks = ? WHERE id = ?",
+                (packed_marks, result_id),
+            )
+            if packed_marks is None:
+                cursor.executemany(
+                    """
+                    INSERT INTO question_marks
+                    (result_id, question_number, part_a, part_b, part_c, part_d)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                    [
+                        (result_id, q_num, *marks[0, q_num - 1].tolist())
+                        for q_num in range(1, QUESTION_COUNT + 1)
+                    ],
+                )
+
+        cursor.executemany(
+            """
+            UPDATE question_marks
+            SET part_a = ?, part_b = ?, part_c = ?, part_d = ?
+            WHERE result_id = ? AND question_number = ?
+        """,
+            stored_rows,
+        )
+
     def get_detailed_analysis(self, class_year, subject, exam_type):
         """Get detailed analysis of exam results"""
-        with self.get_connection() as conn:
+        with self.read_connection() as conn:
             cursor = conn.cursor()
 
             analysis = {
@@ -547,7 +1082,7 @@ class ResultsDatabase:
             # Get question-wise statistics
             for q_num in range(1, 7):
                 cursor.execute(
-                    """
+                    f"""
                     SELECT 
                         AVG(part_a) as avg_a,
                         AVG(part_b) as avg_b,
@@ -555,12 +1090,16 @@ class ResultsDatabase:
                         AVG(part_d) as avg_d,
                         MAX(part_a + part_b + part_c + part_d) as max_total,
                         MIN(part_a + part_b + part_c + part_d) as min_total
-                    FROM question_marks qm
-                    JOIN students_results sr ON sr.id = qm.result_id
-                    WHERE sr.class_year = ? AND sr.subject = ? 
-                    AND sr.exam_type = ? AND qm.question_number = ?
+                    FROM (
+                        SELECT {part_columns_sql('qm', 'sr.packed_marks', q_num)}
+                        FROM students_results sr
+                        LEFT JOIN question_marks qm
+                            ON qm.result_id = sr.id AND qm.question_number = ?
+                        WHERE sr.class_year = ? AND sr.subject = ? 
+                        AND sr.exam_type = ?
+                    )
                 """,
-                    (class_year, subject, exam_type, q_num),
+                    (q_num, class_year, subject, exam_type),
                 )
 
                 q_stats = cursor.fetchone()
@@ -600,132 +1139,1178 @@ class ResultsDatabase:
                 row[0]: row[1] for row in cursor.fetchall()
             }
 
-            # Get top performers
+            # Top performers and students below the cohort average come from
+            # the maintained ranking rather than sorting the cohort again
+            analysis["top_performers"], analysis["needs_improvement"] = (
+                self.query_ranking(
+                    class_year,
+                    subject,
+                    exam_type,
+                    lambda ranking: (
+                        ranking.top(5),
+                        ranking.bottom(5, below=ranking.average()),
+                    ),
+                )
+            )
+
+            return analysis
+
+    @staticmethod
+    def _bump_version(cursor, class_year, subject, exam_type):
+        """Mark a cohort as changed inside the caller's transaction
+
+        Returns the cohort's new stamp (see get_cohort_stamp).
+        """
+        cursor.execute(
+            """
+            INSERT INTO cohort_versions (class_year, subject, exam_type, version)
+            VALUES (?, ?, ?, 1)
+            ON CONFLICT (class_year, subject, exam_type)
+            DO UPDATE SET version = version + 1,
+                changed_at = strftime('%Y-%m-%d %H:%M:%f', 'now')
+            RETURNING version, changed_at
+        """,
+            (class_year, subject, exam_type),
+        )
+        version, changed_at = cursor.fetchone()
+        return f"{version}@{changed_at}"
+
+    def get_cohort_version(self, class_year, subject, exam_type):
+        """Get the current data version of a cohort (0 if never written)"""
+        with self.read_connection() as conn:
+            cursor = conn.cursor()
             cursor.execute(
                 """
-                SELECT roll_number, total_marks
-                FROM students_results
+                SELECT version FROM cohort_versions
                 WHERE class_year = ? AND subject = ? AND exam_type = ?
-                ORDER BY total_marks DESC
-                LIMIT 5
             """,
                 (class_year, subject, exam_type),
             )
+            row = cursor.fetchone()
+            return row[0] if row else 0
 
-            analysis["top_performers"] = [
-                {"roll_number": row[0], "marks": row[1]} for row in cursor.fetchall()
-            ]
+    def get_cohort_stamp(self, class_year, subject, exam_type):
+        """Get a token that changes whenever a cohort's data changes
 
-            # Get students needing improvement
+        Unlike the bare version it also differs after the tables are
+        recreated, so it is safe to hand out in ETags.
+        """
+        with self.read_connection() as conn:
+            cursor = conn.cursor()
             cursor.execute(
                 """
-                SELECT roll_number, total_marks
-                FROM students_results
+                SELECT version, changed_at FROM cohort_versions
                 WHERE class_year = ? AND subject = ? AND exam_type = ?
-                    AND total_marks < (
-                        SELECT AVG(total_marks) 
-                        FROM students_results 
-                        WHERE class_year = ? AND subject = ? AND exam_type = ?
-                    )
-                ORDER BY total_marks ASC
-                LIMIT 5
             """,
-                (class_year, subject, exam_type, class_year, subject, exam_type),
+                (class_year, subject, exam_type),
             )
+            row = cursor.fetchone()
+            return f"{row[0]}@{row[1]}" if row else "0"
 
-            analysis["needs_improvement"] = [
-                {"roll_number": row[0], "marks": row[1]} for row in cursor.fetchall()
-            ]
+    def query_ranking(self, class_year, subject, exam_type, reader):
+        """Run reader on the cohort's CohortRanking, loading it if stale"""
 
-            return analysis
+        def load():
+            with self.read_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    SELECT roll_number, academic_year, total_marks
+                    FROM students_results
+                    WHERE class_year = ? AND subject = ? AND exam_type = ?
+                """,
+                    (class_year, subject, exam_type),
+                )
+                return cursor.fetchall()
+
+        return self.ranks.query(
+            (class_year, subject, exam_type),
+            self.get_cohort_stamp(class_year, subject, exam_type),
+            load,
+            reader,
+        )
+
+    def get_student_standing(self, class_year, subject, exam_type, roll_number):
+        """Rank and percentile of a student's results within a cohort"""
+        return self.query_ranking(
+            class_year,
+            subject,
+            exam_type,
+            lambda ranking: ranking.standing(roll_number),
+        )
+
+    def iter_mark_rows(self, class_year, subject, exam_type):
+        """Stream a cohort's marks as long (result, question) rows
+
+        Rows are (result_id, roll_number, total_marks, question_number,
+        part_a, part_b, part_c, part_d, packed_marks), ordered by roll
+        number. A packed result is a single row with NULL question columns
+        and its blob, left for build_mark_matrix to decode, so packed cohorts
+        are read without touching question_marks. The connection stays open
+        until the generator is exhausted or closed.
+        """
+        with self.read_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT sr.id, sr.roll_number, sr.total_marks,
+                       qm.question_number, qm.part_a, qm.part_b, qm.part_c, qm.part_d,
+                       sr.packed_marks
+                FROM students_results sr
+                LEFT JOIN question_marks qm
+                    ON sr.packed_marks IS NULL AND sr.id = qm.result_id
+                WHERE sr.class_year = ? AND sr.subject = ? AND sr.exam_type = ?
+                ORDER BY sr.roll_number, sr.id, qm.question_number
+            """,
+                (class_year, subject, exam_type),
+            )
+            yield from cursor
+
+    def iter_cohort_mark_rows(
+        self, class_year=None, subject=None, exam_type=None, academic_year=None
+    ):
+        """Stream the marks of every cohort matching the filters in one scan
+
+        Rows are (class_year, subject, exam_type) followed by an
+        iter_mark_rows row, ordered by cohort and then roll number.
+        """
+        query = """
+            SELECT sr.class_year, sr.subject, sr.exam_type,
+                   sr.id, sr.roll_number, sr.total_marks,
+                   qm.question_number, qm.part_a, qm.part_b, qm.part_c, qm.part_d,
+                   sr.packed_marks
+            FROM students_results sr
+            LEFT JOIN question_marks qm
+                ON sr.packed_marks IS NULL AND sr.id = qm.result_id
+            WHERE 1=1
+        """
+        params = []
+        for column, value in (
+            ("class_year", class_year),
+            ("subject", subject),
+            ("exam_type", exam_type),
+            ("academic_year", academic_year),
+        ):
+            if value:
+                query += f" AND sr.{column} = ?"
+                params.append(value)
+        query += """
+            ORDER BY sr.class_year, sr.subject, sr.exam_type,
+                     sr.roll_number, sr.id, qm.question_number
+        """
+
+        with self.read_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            yield from cursor
+
+    def get_mark_rows_page(self, class_year, subject, exam_type, after=None, limit=100):
+        """Get one keyset page of a cohort's marks as long rows
+
+        The page holds the results of the first ``limit`` roll numbers
+        greater than ``after`` (from the start when None). Returns
+        (rows, next_cursor); next_cursor is None on the last page.
+        """
+        with self.read_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                WITH page AS (
+                    SELECT DISTINCT roll_number FROM students_results
+                    WHERE class_year = ? AND subject = ? AND exam_type = ?
+                        AND roll_number > ?
+                    ORDER BY roll_number
+                    LIMIT ?
+                )
+                SELECT sr.id, sr.roll_number, sr.total_marks,
+                       qm.question_number, qm.part_a, qm.part_b, qm.part_c, qm.part_d,
+                       sr.packed_marks
+                FROM page
+                JOIN students_results sr
+                    ON sr.roll_number = page.roll_number AND sr.class_year = ?
+                    AND sr.subject = ? AND sr.exam_type = ?
+                LEFT JOIN question_marks qm
+                    ON sr.packed_marks IS NULL AND sr.id = qm.result_id
+                ORDER BY sr.roll_number, sr.id, qm.question_number
+            """,
+                (
+                    class_year,
+                    subject,
+                    exam_type,
+                    after or "",
+                    limit + 1,
+                    class_year,
+                    subject,
+                    exam_type,
+                ),
+            )
+            rows = cursor.fetchall()
+
+        # One roll number past the page tells whether another page exists
+        roll_numbers = []
+        for row in rows:
+            if not roll_numbers or roll_numbers[-1] != row[1]:
+                roll_numbers.append(row[1])
+        if len(roll_numbers) <= limit:
+            return rows, None
+
+        extra = roll_numbers[limit]
+        return [row for row in rows if row[1] != extra], roll_numbers[limit - 1]
+
+    def get_mark_rows(self, class_year, subject, exam_type):
+        """Get a cohort's marks as a list of long rows (see iter_mark_rows)"""
+        return list(self.iter_mark_rows(class_year, subject, exam_type))
+
+    def get_progression_rows(
+        self, class_year, subject, from_exam, to_exam, academic_year=None
+    ):
+        """Pair each student's results across two exam types
+
+        Returns one row per (student, question) with both exams' totals and
+        part marks side by side, ordered by academic year and roll number.
+        """
+        query = f"""
+            SELECT a.roll_number, a.academic_year, a.total_marks, b.total_marks,
+                   q.question_number,
+                   {part_columns_sql('qa', 'a.packed_marks', 'q.question_number')},
+                   {part_columns_sql('qb', 'b.packed_marks', 'q.question_number')}
+            FROM students_results a
+            JOIN students_results b
+                ON b.roll_number = a.roll_number AND b.class_year = a.class_year
+                AND b.subject = a.subject AND b.exam_type = ?
+                AND b.academic_year = a.academic_year
+            CROSS JOIN {QUESTION_NUMBERS_SQL} q
+            LEFT JOIN question_marks qa
+                ON qa.result_id = a.id AND qa.question_number = q.question_number
+            LEFT JOIN question_marks qb
+                ON qb.result_id = b.id AND qb.question_number = q.question_number
+            WHERE a.class_year = ? AND a.subject = ? AND a.exam_type = ?
+        """
+        params = [to_exam, class_year, subject, from_exam]
+        if academic_year:
+            query += " AND a.academic_year = ?"
+            params.append(academic_year)
+        query += " ORDER BY a.academic_year, a.roll_number, q.question_number"
+
+        with self.read_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            return cursor.fetchall()
 
     def update_result(
         self, roll_number, class_year, subject, exam_type, question_marks, total_marks
     ):
         """Update marks for a student"""
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
+        try:
+            question_rows = self._parse_question_marks(question_marks)
+            total_marks = self._parse_total_marks(total_marks)
+        except ValueError as e:
+            return False, str(e)
+
+        def job(cursor):
+            # First update the main result
+            cursor.execute(
+                """
+                UPDATE students_results 
+                SET total_marks = ?
+                WHERE roll_number = ? AND class_year = ? AND subject = ? AND exam_type = ?
+                RETURNING id, academic_year
+            """,
+                (total_marks, roll_number, class_year, subject, exam_type),
+            )
+
+            updated = cursor.fetchall()
+            if not updated:
+                return None
+
+            result_id = updated[0][0]
+
+            # Update question marks
+            self._update_question_marks(
+                cursor,
+                [(*parts, result_id, q_num) for *parts, q_num in question_rows],
+            )
+
+            return updated, self._bump_version(cursor, class_year, subject, exam_type)
+
+        try:
+            outcome = self.writer.run(job)
+        except Exception as e:
+            return False, str(e)
+        if outcome is None:
+            return False, "Result not found"
+
+        updated, stamp = outcome
+        self.ranks.apply(
+            (class_year, subject, exam_type),
+            stamp,
+            [(roll_number, year, total_marks) for _, year in updated],
+        )
+        self.refresh_cube(
+            [(class_year, subject, exam_type, year) for _, year in updated]
+        )
+        return True, "Marks updated successfully"
+
+    def delete_result(self, roll_number, class_year, subject, exam_type):
+        """Delete a student's result"""
+
+        def job(cursor):
+            # First get the result ID
+            cursor.execute(
+                """
+                SELECT id, academic_year FROM students_results
+                WHERE roll_number = ? AND class_year = ? AND subject = ? AND exam_type = ?
+            """,
+                (roll_number, class_year, subject, exam_type),
+            )
+
+            result = cursor.fetchone()
+            if not result:
+                return None
+
+            result_id, academic_year = result
+
+            # Delete question marks first (due to foreign key constraint)
+            cursor.execute(
+                "DELETE FROM question_marks WHERE result_id = ?", (result_id,)
+            )
+
+            # Then delete the main result
+            cursor.execute(
+                """
+                DELETE FROM students_results
+                WHERE id = ?
+            """,
+                (result_id,),
+            )
+
+            return academic_year, self._bump_version(
+                cursor, class_year, subject, exam_type
+            )
+
+        try:
+            outcome = self.writer.run(job)
+        except Exception as e:
+            return False, str(e)
+        if outcome is None:
+            return False, "Result not found"
+
+        academic_year, stamp = outcome
+        self.ranks.apply(
+            (class_year, subject, exam_type),
+            stamp,
+            [(roll_number, academic_year, None)],
+        )
+        self.refresh_cube([(class_year, subject, exam_type, academic_year)])
+        return True, "Result deleted successfully"
+
+    def _resolve_batch_keys(self, cursor, keys):
+        """Map (index, roll_number, class_year, subject, exam_type) keys to results
+
+        Returns {index: [(result_id, academic_year), ...]} using one join
+        against a temporary key table instead of one lookup per key.
+        """
+        cursor.execute(
+            """
+            CREATE TEMP TABLE IF NOT EXISTS batch_keys (
+                idx INTEGER PRIMARY KEY,
+                roll_number TEXT, class_year TEXT, subject TEXT, exam_type TEXT
+            )
+        """
+        )
+        cursor.execute("DELETE FROM batch_keys")
+        cursor.executemany("INSERT INTO batch_keys VALUES (?, ?, ?, ?, ?)", keys)
+        cursor.execute(
+            """
+            SELECT k.idx, sr.id, sr.academic_year
+            FROM batch_keys k
+            JOIN students_results sr
+                ON sr.roll_number = k.roll_number AND sr.class_year = k.class_year
+                AND sr.subject = k.subject AND sr.exam_type = k.exam_type
+        """
+        )
+        matches = {}
+        for idx, result_id, academic_year in cursor.fetchall():
+            matches.setdefault(idx, []).append((result_id, academic_year))
+        return matches
+
+    @staticmethod
+    def _batch_key(index, entry):
+        if not isinstance(entry, dict):
+            return None
+        key = [entry.get(field) for field in RESULT_KEY_FIELDS]
+        if not all(key):
+            return None
+        return (index, *key)
+
+    def update_results_batch(self, edits):
+        """Apply many mark edits in a single transaction
+
+        Each edit has the update_result fields (roll_number, class_year,
+        subject, exam_type, questions, total_marks). Returns one
+        {"index", "roll_number", "success", "message"} report per edit.
+        Edits that fail validation are reported and skipped; a database
+        error rolls back the whole batch.
+        """
+        reports = [
+            {
+                "index": index,
+                "roll_number": (
+                    edit.get("roll_number") if isinstance(edit, dict) else None
+                ),
+                "success": False,
+                "message": "Missing required fields",
+            }
+            for index, edit in enumerate(edits)
+        ]
+
+        keys = []
+        question_updates = {}
+        totals = {}
+        for index, edit in enumerate(edits):
+            key = self._batch_key(index, edit)
+            if not key or not edit.get("questions") or edit.get("total_marks") is None:
+                continue
             try:
-                # First update the main result
+                question_updates[index] = self._parse_question_marks(edit["questions"])
+                totals[index] = self._parse_total_marks(edit["total_marks"])
+            except ValueError as e:
+                reports[index]["message"] = str(e)
+                continue
+            keys.append(key)
+
+        cells = set()
+        rank_changes = {}
+
+        def job(cursor):
+            matches = self._resolve_batch_keys(cursor, keys)
+
+            total_rows = []
+            part_rows = []
+            for index, *key in keys:
+                results = matches.get(index)
+                if not results:
+                    reports[index]["message"] = "Result not found"
+                    continue
+                for result_id, academic_year in results:
+                    total_rows.append((totals[index], result_id))
+                    part_rows.extend(
+                        (*parts, result_id, q_num)
+                        for *parts, q_num in question_updates[index]
+                    )
+                    cells.add((key[1], key[2], key[3], academic_year))
+                    rank_changes.setdefault(tuple(key[1:]), []).append(
+                        (key[0], academic_year, totals[index])
+                    )
+                reports[index]["success"] = True
+                reports[index]["message"] = "Marks updated successfully"
+
+            cursor.executemany(
+                "UPDATE students_results SET total_marks = ? WHERE id = ?",
+                total_rows,
+            )
+            self._update_question_marks(cursor, part_rows)
+            return {
+                cohort: self._bump_version(cursor, *cohort) for cohort in rank_changes
+            }
+
+        try:
+            stamps = self.writer.run(job)
+        except (sqlite3.Error, WriterBusy) as e:
+            for report in reports:
+                report["success"] = False
+                report["message"] = f"Batch rolled back: {e}"
+            return reports
+
+        for cohort, changes in rank_changes.items():
+            self.ranks.apply(cohort, stamps[cohort], changes)
+        self.refresh_cube(cells)
+        return reports
+
+    def delete_results_batch(self, deletions):
+        """Delete many results in a single transaction
+
+        Each deletion has roll_number, class_year, subject and exam_type.
+        Returns per-row reports like update_results_batch.
+        """
+        reports = [
+            {
+                "index": index,
+                "roll_number": (
+                    deletion.get("roll_number") if isinstance(deletion, dict) else None
+                ),
+                "success": False,
+                "message": "Missing required fields",
+            }
+            for index, deletion in enumerate(deletions)
+        ]
+        keys = [
+            key
+            for key in (
+                self._batch_key(index, deletion)
+                for index, deletion in enumerate(deletions)
+            )
+            if key
+        ]
+
+        cells = set()
+        rank_changes = {}
+
+        def job(cursor):
+            matches = self._resolve_batch_keys(cursor, keys)
+
+            result_ids = []
+            for index, *key in keys:
+                results = matches.get(index)
+                if not results:
+                    reports[index]["message"] = "Result not found"
+                    continue
+                for result_id, academic_year in results:
+                    result_ids.append((result_id,))
+                    cells.add((key[1], key[2], key[3], academic_year))
+                    rank_changes.setdefault(tuple(key[1:]), []).append(
+                        (key[0], academic_year, None)
+                    )
+                reports[index]["success"] = True
+                reports[index]["message"] = "Result deleted successfully"
+
+            # Delete question marks first (due to foreign key constraint)
+            cursor.executemany(
+                "DELETE FROM question_marks WHERE result_id = ?", result_ids
+            )
+            cursor.executemany("DELETE FROM students_results WHERE id = ?", result_ids)
+            return {
+                cohort: self._bump_version(cursor, *cohort) for cohort in rank_changes
+            }
+
+        try:
+            stamps = self.writer.run(job)
+        except (sqlite3.Error, WriterBusy) as e:
+            for report in reports:
+                report["success"] = False
+                report["message"] = f"Batch rolled back: {e}"
+            return reports
+
+        for cohort, changes in rank_changes.items():
+            self.ranks.apply(cohort, stamps[cohort], changes)
+        self.refresh_cube(cells)
+        return reports
+
+    def _cube_cell_select(self, where):
+        """Build the aggregate SELECT that computes cube cells for a filter
+
+        Departments come from the writer's temp.cube_departments, filled by
+        _load_cube_departments in the same job.
+        """
+        band_columns = []
+        for _, low, high in MARK_BANDS:
+            condition = f"sr.total_marks >= {low}"
+            if high is not None:
+                condition += f" AND sr.total_marks < {high}"
+            band_columns.append(f"SUM(CASE WHEN {condition} THEN 1 ELSE 0 END)")
+
+        return f"""
+            SELECT
+                COALESCE(st.department, 'UNASSIGNED') as department,
+                sr.academic_year, sr.class_year, sr.subject, sr.exam_type,
+                COUNT(*),
+                SUM(sr.total_marks),
+                SUM(sr.total_marks * sr.total_marks),
+                MIN(sr.total_marks),
+                MAX(sr.total_marks),
+                SUM(CASE WHEN sr.total_marks >= {PASS_MARK} THEN 1 ELSE 0 END),
+                {", ".join(band_columns)}
+            FROM students_results sr
+            LEFT JOIN temp.cube_departments st ON st.id = sr.roll_number
+            WHERE {where}
+            GROUP BY 1, sr.academic_year, sr.class_year, sr.subject, sr.exam_type
+        """
+
+    def refresh_cube(self, cells):
+        """Recompute the cube cells of the given cohorts
+
+        cells is an iterable of (class_year, subject, exam_type, academic_year)
+        tuples; every department cell of those cohorts is rebuilt from
+        students_results, so only the touched slice of history is rescanned.
+        Cells of frozen academic years are archived with them and kept as is.
+        """
+        frozen = self.shards.frozen_years()
+        cells = {cell for cell in cells if cell[3] not in frozen}
+        if not cells:
+            return
+
+        where = (
+            "sr.class_year = ? AND sr.subject = ? "
+            "AND sr.exam_type = ? AND sr.academic_year = ?"
+        )
+
+        def job(cursor):
+            self._load_cube_departments(cursor, departments)
+            select = self._cube_cell_select(where)
+            for cell in cells:
+                cursor.execute(
+                    """
+                    DELETE FROM results_cube
+                    WHERE class_year = ? AND subject = ? AND exam_type = ? AND academic_year = ?
+                """,
+                    cell,
+                )
+                cursor.execute(
+                    f"INSERT INTO results_cube ({', '.join(self._cube_columns())}) "
+                    + select,
+                    cell,
+                )
+                cursor.execute(
+                    """
+                    DELETE FROM results_catalog
+                    WHERE class_year = ? AND subject = ? AND exam_type = ? AND academic_year = ?
+                """,
+                    cell,
+                )
                 cursor.execute(
                     """
-                    UPDATE students_results 
-                    SET total_marks = ?
-                    WHERE roll_number = ? AND class_year = ? AND subject = ? AND exam_type = ?
-                    RETURNING id
+                    INSERT INTO results_catalog
+                    SELECT class_year, subject, exam_type, academic_year,
+                        SUM(student_count)
+                    FROM results_cube
+                    WHERE class_year = ? AND subject = ? AND exam_type = ? AND academic_year = ?
+                    GROUP BY class_year, subject, exam_type, academic_year
                 """,
-                    (total_marks, roll_number, class_year, subject, exam_type),
+                    cell,
                 )
 
-                result = cursor.fetchone()
-                if not result:
-                    return False, "Result not found"
-
-                result_id = result[0]
-
-                # Update question marks
-                for q_num, marks in question_marks.items():
-                    cursor.execute(
-                        """
-                        UPDATE question_marks
-                        SET part_a = ?, part_b = ?, part_c = ?, part_d = ?
-                        WHERE result_id = ? AND question_number = ?
-                    """,
-                        (
-                            marks["a"],
-                            marks["b"],
-                            marks["c"],
-                            marks["d"],
-                            result_id,
-                            int(q_num[1]),
-                        ),
-                    )
+        try:
+            departments = set()
+            for cell in cells:
+                departments.update(self._cube_departments(where, cell))
+            self.writer.run(job)
+        except (sqlite3.Error, WriterBusy) as e:
+            print(f"Cube refresh error: {e}")
+        self._catalog_cache.clear()
+
+    def _cube_departments(self, where, params=()):
+        """(roll_number, department) of the students with results matching where
+
+        The students table is read through the read pool, as the writer's
+        connection has no other stores attached.
+        """
+        with self.read_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"""
+                SELECT DISTINCT sr.roll_number, st.department
+                FROM students_results sr
+                JOIN users.students st ON st.id = sr.roll_number
+                WHERE {where}
+            """,
+                params,
+            )
+            return cursor.fetchall()
 
-                conn.commit()
-                return True, "Marks updated successfully"
-            except Exception as e:
-                conn.rollback()
-                return False, str(e)
+    @staticmethod
+    def _load_cube_departments(cursor, departments):
+        """Fill the writer's temp.cube_departments for _cube_cell_select"""
+        cursor.execute(
+            """
+            CREATE TEMP TABLE IF NOT EXISTS cube_departments (
+                id TEXT PRIMARY KEY,
+                department TEXT
+            )
+        """
+        )
+        cursor.execute("DELETE FROM temp.cube_departments")
+        cursor.executemany(
+            "INSERT OR REPLACE INTO temp.cube_departments VALUES (?, ?)", departments
+        )
+
+    def refresh_cube_for_roll(self, roll_number):
+        """Recompute the cube cells containing a student's results"""
+        self.refresh_cube_for_rolls([roll_number])
+
+    def refresh_cube_for_rolls(self, roll_numbers):
+        """Recompute the cube cells containing any of the students' results"""
+        with self.read_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS cube_rolls (id TEXT)")
+            cursor.execute("DELETE FROM cube_rolls")
+            cursor.executemany(
+                "INSERT INTO cube_rolls VALUES (?)", [(roll,) for roll in roll_numbers]
+            )
+            cursor.execute(
+                """
+                SELECT DISTINCT class_year, subject, exam_type, academic_year
+                FROM students_results
+                WHERE roll_number IN (SELECT id FROM cube_rolls)
+            """
+            )
+            cells = cursor.fetchall()
+        self.refresh_cube(cells)
 
-    def delete_result(self, roll_number, class_year, subject, exam_type):
-        """Delete a student's result"""
-        with self.get_connection() as conn:
+    def rebuild_cube(self):
+        """Recompute every cube cell of the live academic years from scratch"""
+
+        live = "academic_year NOT IN (SELECT academic_year FROM main.results_shards)"
+        departments = self._cube_departments(f"sr.{live}")
+
+        def job(cursor):
+            self._load_cube_departments(cursor, departments)
+            cursor.execute(f"DELETE FROM results_cube WHERE {live}")
+            cursor.execute(
+                f"INSERT INTO results_cube ({', '.join(self._cube_columns())}) "
+                + self._cube_cell_select(f"sr.{live}")
+            )
+            cursor.execute("DELETE FROM results_catalog")
+            cursor.execute(
+                """
+                INSERT INTO results_catalog
+                SELECT class_year, subject, exam_type, academic_year,
+                    SUM(student_count)
+                FROM results_cube
+                GROUP BY class_year, subject, exam_type, academic_year
+            """
+            )
+
+        self.writer.run(job)
+        self._catalog_cache.clear()
+
+    @staticmethod
+    def _cube_columns():
+        return [
+            *CUBE_DIMENSIONS,
+            "student_count",
+            "marks_sum",
+            "marks_sq_sum",
+            "min_marks",
+            "max_marks",
+            "passed_count",
+            *[f"band_{name.replace('-', '_')}" for name, _, _ in MARK_BANDS],
+        ]
+
+    def rollup(self, group_by=(), filters=None):
+        """Aggregate cube cells along the requested dimensions
+
+        group_by lists the dimensions to keep (drill down by adding one, roll
+        up by removing one); filters maps dimensions to required values.
+        """
+        filters = filters or {}
+        for dimension in list(group_by) + list(filters):
+            if dimension not in CUBE_DIMENSIONS:
+                raise ValueError(f"Unknown dimension: {dimension}")
+
+        band_names = [name for name, _, _ in MARK_BANDS]
+        band_sums = ", ".join(
+            f"SUM(band_{name.replace('-', '_')})" for name in band_names
+        )
+        select_dims = "".join(f"{dimension}, " for dimension in group_by)
+        query = f"""
+            SELECT {select_dims}
+                SUM(student_count), SUM(marks_sum), SUM(marks_sq_sum),
+                MIN(min_marks), MAX(max_marks), SUM(passed_count), {band_sums}
+            FROM results_cube
+            WHERE 1=1
+        """
+        params = []
+        for dimension, value in filters.items():
+            query += f" AND {dimension} = ?"
+            params.append(value)
+        if group_by:
+            query += f" GROUP BY {', '.join(group_by)} ORDER BY {', '.join(group_by)}"
+
+        with self.read_connection() as conn:
             cursor = conn.cursor()
-            try:
-                # First get the result ID
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+
+        cells = []
+        for row in rows:
+            keys = dict(zip(group_by, row[: len(group_by)]))
+            count, total, sq_total, lowest, highest, passed = row[
+                len(group_by) : len(group_by) + 6
+            ]
+            bands = row[len(group_by) + 6 :]
+            if not count:
+                continue
+
+            average = total / count
+            variance = max(sq_total / count - average * average, 0)
+            cells.append(
+                {
+                    **keys,
+                    "total_students": count,
+                    "average_marks": round(average, 2),
+                    "std_dev": round(variance**0.5, 2),
+                    "highest_marks": highest,
+                    "lowest_marks": lowest,
+                    "pass_percentage": round(passed / count * 100, 2),
+                    "student_distribution": dict(zip(band_names, bands)),
+                }
+            )
+        return cells
+
+    def _cached(self, key, loader):
+        """Serve a catalog-derived value from memory for CATALOG_CACHE_TTL"""
+        now = time.monotonic()
+        cached = self._catalog_cache.get(key)
+        if cached and cached[0] > now:
+            return cached[1]
+        value = loader()
+        self._catalog_cache[key] = (now + CATALOG_CACHE_TTL, value)
+        return value
+
+    def get_catalog(self):
+        """Known result combinations and the distinct values of each field"""
+
+        def load():
+            with self.read_connection() as conn:
+                cursor = conn.cursor()
                 cursor.execute(
                     """
-                    SELECT id FROM students_results
-                    WHERE roll_number = ? AND class_year = ? AND subject = ? AND exam_type = ?
-                """,
-                    (roll_number, class_year, subject, exam_type),
+                    SELECT class_year, subject, exam_type, academic_year, result_count
+                    FROM results_catalog
+                    ORDER BY class_year, subject, exam_type, academic_year
+                """
                 )
+                rows = cursor.fetchall()
+
+            return {
+                "entries": [
+                    {
+                        "class_year": row[0],
+                        "subject": row[1],
+                        "exam_type": row[2],
+                        "academic_year": row[3],
+                        "result_count": row[4],
+                    }
+                    for row in rows
+                ],
+                "years": sorted({row[0] for row in rows}),
+                "subjects": sorted({row[1] for row in rows}),
+                "exam_types": sorted({row[2] for row in rows}),
+                "academic_years": sorted({row[3] for row in rows}),
+            }
+
+        return self._cached("catalog", load)
 
-                result = cursor.fetchone()
-                if not result:
-                    return False, "Result not found"
+    def get_marks_overview(self):
+        """Dropdown values and per-cohort statistics for the marks overview
 
-                result_id = result[0]
+        Years and subjects combine the classes and subjects defined in the
+        analysis store with those in the results catalog; statistics come
+        from the cube.
+        """
 
-                # Delete question marks first (due to foreign key constraint)
+        def load():
+            with self.read_connection() as conn:
+                cursor = conn.cursor()
                 cursor.execute(
-                    "DELETE FROM question_marks WHERE result_id = ?", (result_id,)
+                    """
+                    SELECT year || ' (' || academic_year || ')' FROM analysis.classes
+                    UNION
+                    SELECT class_year FROM results_catalog
+                    ORDER BY 1
+                """
                 )
+                years = [row[0] for row in cursor.fetchall()]
 
-                # Then delete the main result
                 cursor.execute(
                     """
-                    DELETE FROM students_results
-                    WHERE id = ?
-                """,
-                    (result_id,),
+                    SELECT s.name
+                    FROM analysis.subjects s
+                    JOIN analysis.classes c ON s.class_id = c.id
+                    UNION
+                    SELECT subject FROM results_catalog
+                    ORDER BY 1
+                """
                 )
+                subjects = [row[0] for row in cursor.fetchall()]
 
-                conn.commit()
-                return True, "Result deleted successfully"
-            except Exception as e:
-                conn.rollback()
-                return False, str(e)
+                cursor.execute(
+                    "SELECT DISTINCT exam_type FROM results_catalog ORDER BY exam_type"
+                )
+                exam_types = [row[0] for row in cursor.fetchall()]
+
+            class_stats = {}
+            for cell in self.rollup(("class_year", "subject", "exam_type")):
+                class_stats.setdefault(cell["class_year"], {}).setdefault(
+                    cell["subject"], {}
+                )[cell["exam_type"]] = {
+                    "total_students": cell["total_students"],
+                    "avg_marks": cell["average_marks"],
+                    "max_marks": cell["highest_marks"],
+                    "min_marks": cell["lowest_marks"],
+                    "pass_percentage": cell["pass_percentage"],
+                }
+
+            return {
+                "years": years,
+                "subjects": subjects,
+                "exam_types": exam_types,
+                "class_stats": class_stats,
+            }
+
+        return self._cached("overview", load)
+
+    def get_cohort_roster(self, class_year, subject, exam_type, department=None):
+        """A cohort's results joined to the registered students' details"""
+        query = """
+            SELECT sr.roll_number, st.full_name, st.department,
+                sr.academic_year, sr.total_marks
+            FROM students_results sr
+            LEFT JOIN users.students st ON st.id = sr.roll_number
+            WHERE sr.class_year = ? AND sr.subject = ? AND sr.exam_type = ?
+        """
+        params = [class_year, subject, exam_type]
+        if department:
+            query += " AND st.department = ?"
+            params.append(department)
+        query += " ORDER BY sr.roll_number, sr.academic_year"
+
+        with self.read_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            return [
+                {
+                    "roll_number": row[0],
+                    "full_name": row[1],
+                    "department": row[2],
+                    "academic_year": row[3],
+                    "total_marks": row[4],
+                }
+                for row in cursor.fetchall()
+            ]
+
+    def publish_student_summaries(self):
+        """Precompute every student's results summary
+
+        Ranks and percentiles are taken within each cohort
+        (class_year, subject, exam_type, academic_year). Returns the number of
+        students published, or None on error.
+        """
+        published_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        try:
+            with self.read_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    SELECT roll_number, class_year, subject, exam_type, academic_year,
+                        total_marks,
+                        RANK() OVER cohort_desc,
+                        COUNT(*) OVER cohort,
+                        PERCENT_RANK() OVER cohort_asc,
+                        AVG(total_marks) OVER cohort
+                    FROM students_results
+                    WINDOW cohort AS (
+                            PARTITION BY class_year, subject, exam_type, academic_year
+                        ),
+                        cohort_desc AS (cohort ORDER BY total_marks DESC),
+                        cohort_asc AS (cohort ORDER BY total_marks)
+                    ORDER BY roll_number, academic_year, class_year, subject, exam_type
+                """
+                )
+
+                summaries = []
+                current_roll = None
+                results = []
+                for row in cursor:
+                    roll_number = row[0]
+                    if roll_number != current_roll:
+                        if current_roll is not None:
+                            summaries.append(
+                                self._summary_row(current_roll, results, published_at)
+                            )
+                        current_roll = roll_number
+                        results = []
+                    results.append(
+                        {
+                            "class_year": row[1],
+                            "subject": row[2],
+                            "exam_type": row[3],
+                            "academic_year": row[4],
+                            "total_marks": row[5],
+                            "passed": row[5] >= PASS_MARK,
+                            "rank": row[6],
+                            "cohort_size": row[7],
+                            "percentile": round(row[8] * 100, 1),
+                            "cohort_average": round(row[9], 2),
+                        }
+                    )
+                if current_roll is not None:
+                    summaries.append(
+                        self._summary_row(current_roll, results, published_at)
+                    )
+        except sqlite3.Error as e:
+            print(f"Publish error: {e}")
+            return None
+
+        def job(cursor):
+            cursor.execute("DELETE FROM student_summaries")
+            cursor.executemany(
+                """
+                INSERT INTO student_summaries (roll_number, payload, published_at)
+                VALUES (?, ?, ?)
+            """,
+                summaries,
+            )
+
+        try:
+            self.writer.run(job)
+        except (sqlite3.Error, WriterBusy) as e:
+            print(f"Publish error: {e}")
+            return None
+
+        with self._summary_lock:
+            self._summary_cache.clear()
+        return len(summaries)
+
+    @staticmethod
+    def _summary_row(roll_number, results, published_at):
+        totals = [result["total_marks"] for result in results]
+        payload = {
+            "roll_number": roll_number,
+            "published_at": published_at,
+            "exams_taken": len(results),
+            "average_marks": round(sum(totals) / len(totals), 2),
+            "passed_count": sum(result["passed"] for result in results),
+            "results": results,
+        }
+        return roll_number, json.dumps(payload), published_at
+
+    def get_student_summary(self, roll_number):
+        """Published results summary for a student, or None if not published"""
+        now = time.monotonic()
+        with self._summary_lock:
+            cached = self._summary_cache.get(roll_number)
+            if cached and cached[0] > now:
+                return cached[1]
+
+        with self.read_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT payload FROM student_summaries WHERE roll_number = ?",
+                (roll_number,),
+            )
+            row = cursor.fetchone()
+        summary = json.loads(row[0]) if row else None
+
+        with self._summary_lock:
+            if len(self._summary_cache) >= SUMMARY_CACHE_SIZE:
+                self._summary_cache = {
+                    key: value
+                    for key, value in self._summary_cache.items()
+                    if value[0] > now
+                }
+                if len(self._summary_cache) >= SUMMARY_CACHE_SIZE:
+                    self._summary_cache.clear()
+            self._summary_cache[roll_number] = (now + SUMMARY_CACHE_TTL, summary)
+        return summary
+
+
+class BatchStore:
+    """Server-side store for extracted upload batches
+
+    The session only keeps the batch ID; results are stored here as
+    compressed JSON and expire after ``ttl`` seconds.
+    """
+
+    def __init__(self, db_file="./database/upload_batches.db", ttl=24 * 60 * 60):
+        self.db_file = db_file
+        self.ttl = ttl
+        self.init_db()
+
+    def get_connection(self):
+        return sqlite3.connect(self.db_file)
+
+    def init_db(self):
+        with self.get_connection() as conn:
+            # Expired batches are deleted constantly; let maintenance reclaim them
+            ensure_incremental_vacuum(conn)
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS upload_batches (
+                    batch_id TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL,
+                    revision INTEGER NOT NULL DEFAULT 1,
+                    expires_at REAL NOT NULL,
+                    payload BLOB NOT NULL
+                )
+            """
+            )
+            cursor.execute(
+                """
+                CREATE INDEX IF NOT EXISTS idx_upload_batches_expiry
+                ON upload_batches (expires_at)
+            """
+            )
+
+    @staticmethod
+    def _encode(results):
+        return zlib.compress(json.dumps(results, separators=(",", ":")).encode())
+
+    @staticmethod
+    def _decode(payload):
+        return json.loads(zlib.decompress(payload))
+
+    def create(self, owner, results):
+        """Store a new batch and return its ID"""
+        batch_id = secrets.token_urlsafe(16)
+        now = time.time()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            # Evict expired batches on write so the store stays bounded
+            cursor.execute("DELETE FROM upload_batches WHERE expires_at < ?", (now,))
+            cursor.execute(
+                """
+                INSERT INTO upload_batches (batch_id, owner, expires_at, payload)
+                VALUES (?, ?, ?, ?)
+            """,
+                (batch_id, owner, now + self.ttl, self._encode(results)),
+            )
+        return batch_id
+
+    def get_revision(self, batch_id, owner):
+        """Get a batch's revision without loading it (None if missing)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT revision FROM upload_batches
+                WHERE batch_id = ? AND owner = ? AND expires_at >= ?
+            """,
+                (batch_id, owner, time.time()),
+            )
+            row = cursor.fetchone()
+            return row[0] if row else None
+
+    def load(self, batch_id, owner):
+        """Get a batch's results, or an empty list if missing or expired"""
+        if not batch_id:
+            return []
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT payload FROM upload_batches
+                WHERE batch_id = ? AND owner = ? AND expires_at >= ?
+            """,
+                (batch_id, owner, time.time()),
+            )
+            row = cursor.fetchone()
+            return self._decode(row[0]) if row else []
+
+    def replace(self, batch_id, owner, results):
+        """Overwrite a batch's results and bump its revision"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                UPDATE upload_batches
+                SET payload = ?, revision = revision + 1
+                WHERE batch_id = ? AND owner = ?
+            """,
+                (self._encode(results), batch_id, owner),
+            )
+            return cursor.rowcount > 0
 
 
 # Initialize the database when the module is imported
@@ -0,0 +1,269 @@
+import csv
+import io
+import json
+import queue
+import re
+import tempfile
+import threading
+from itertools import groupby, islice
+from zipfile import ZipFile, ZIP_DEFLATED
+
+import xlsxwriter
+
+from pivot import iter_mark_matrices
+
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# format -> mimetype of each supported export
+EXPORT_FORMATS = {
+    "xlsx": XLSX_MIMETYPE,
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# Rows per chunk for streamed text formats and per Parquet record batch
+STREAM_BATCH_SIZE = 1000
+PARQUET_BATCH_SIZE = 8192
+
+# Rows read ahead of the writer by prefetch()
+PREFETCH_BATCH_SIZE = 500
+PREFETCH_MAX_BATCHES = 8
+
+# Exports larger than this spill from memory to a temporary file
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+
+def iter_wide_rows(mark_rows):
+    """Turn long (result, question) rows into one wide row per result
+
+    mark_rows is an iterable shaped like ResultsDatabase.iter_mark_rows,
+    ordered by result; yields (roll_number, total_marks, marks) where marks
+    follows MARK_COLUMNS. Rows are pivoted in bounded chunks.
+    """
+    for matrix in iter_mark_matrices(mark_rows):
+        yield from matrix.iter_rows()
+
+
+def write_xlsx(headers, rows, sheet_name="Marks"):
+    """Write rows to an XLSX workbook and return it as a rewound file
+
+    The workbook is written in xlsxwriter's constant-memory mode, one row at
+    a time, and column widths are tracked while writing instead of in a
+    second pass. The result lives in a spooled buffer that only touches
+    disk past SPOOL_MAX_SIZE and is removed when closed.
+    """
+    return write_xlsx_sheets([(sheet_name, headers, rows)])
+
+
+def write_xlsx_sheets(sheets):
+    """Write (sheet_name, headers, rows) tuples as sheets of one workbook
+
+    Sheets are written in order, each one streamed like write_xlsx; sheet
+    names are made valid and unique.
+    """
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    workbook = xlsxwriter.Workbook(output, {"constant_memory": True})
+    header_format = workbook.add_format(
+        {"bold": True, "font_color": "#FFFFFF", "bg_color": "#8B5CF6"}
+    )
+
+    used_names = set()
+    for sheet_name, headers, rows in sheets:
+        worksheet = workbook.add_worksheet(_sheet_name(sheet_name, used_names))
+        widths = [len(str(header)) for header in headers]
+        worksheet.write_row(0, 0, headers, header_format)
+        for row_index, row in enumerate(rows, start=1):
+            worksheet.write_row(row_index, 0, row)
+            for col, value in enumerate(row):
+                length = len(str(value))
+                if length > widths[col]:
+                    widths[col] = length
+
+        for col, width in enumerate(widths):
+            worksheet.set_column(col, col, width + 2)
+
+    workbook.close()
+    output.seek(0)
+    return output
+
+
+def _sheet_name(name, used_names):
+    """Make an Excel-safe sheet name (<= 31 chars, no []:*?/\\) unique"""
+    name = re.sub(r"[\[\]:*?/\\]", "_", name)[:31] or "Sheet"
+    candidate, suffix = name, 1
+    while candidate.lower() in used_names:
+        suffix += 1
+        candidate = f"{name[: 31 - len(str(suffix)) - 1]}_{suffix}"
+    used_names.add(candidate.lower())
+    return candidate
+
+
+def _batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def iter_csv(headers, rows):
+    """Yield CSV text in chunks of STREAM_BATCH_SIZE rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    for batch in _batches(rows, STREAM_BATCH_SIZE):
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_ndjson(headers, rows):
+    """Yield one JSON object per row, in chunks of STREAM_BATCH_SIZE rows"""
+    for batch in _batches(rows, STREAM_BATCH_SIZE):
+        yield "".join(json.dumps(dict(zip(headers, row))) + "\n" for row in batch)
+
+
+def write_parquet(headers, rows):
+    """Write rows to Parquet one record batch at a time
+
+    Column types are inferred from the first batch. Returns a rewound
+    spooled buffer like write_xlsx.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires the pyarrow package")
+
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    writer = None
+    for batch in _batches(rows, PARQUET_BATCH_SIZE):
+        columns = list(zip(*batch))
+        if writer is None:
+            record_batch = pa.RecordBatch.from_arrays(
+                [pa.array(column) for column in columns], names=list(headers)
+            )
+            writer = pq.ParquetWriter(output, record_batch.schema)
+        else:
+            record_batch = pa.RecordBatch.from_arrays(
+                [
+                    pa.array(column, type=field.type)
+                    for column, field in zip(columns, writer.schema)
+                ],
+                schema=writer.schema,
+            )
+        writer.write_batch(record_batch)
+
+    if writer is None:
+        writer = pq.ParquetWriter(
+            output, pa.schema([(header, pa.string()) for header in headers])
+        )
+    writer.close()
+    output.seek(0)
+    return output
+
+
+def prefetch(rows):
+    """Read rows on a background thread while the caller consumes them
+
+    Up to PREFETCH_MAX_BATCHES batches are buffered, so a writer works on
+    one cohort while the next is already being read. The reader stops if
+    the consumer goes away; reader errors are re-raised to the consumer.
+    """
+    batches = queue.Queue(maxsize=PREFETCH_MAX_BATCHES)
+    stopped = threading.Event()
+    done = object()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read():
+        try:
+            for batch in _batches(rows, PREFETCH_BATCH_SIZE):
+                if not put(batch):
+                    return
+            put(done)
+        except Exception as e:
+            put(e)
+
+    reader = threading.Thread(target=read, daemon=True)
+    reader.start()
+    try:
+        while True:
+            batch = batches.get()
+            if batch is done:
+                return
+            if isinstance(batch, Exception):
+                raise batch
+            yield from batch
+    finally:
+        stopped.set()
+
+
+def iter_cohorts(cohort_rows):
+    """Split cohort-ordered mark rows into per-cohort wide rows
+
+    cohort_rows are (class_year, subject, exam_type, *mark_row) ordered by
+    cohort; yields ((class_year, subject, exam_type), wide_rows), where each
+    wide_rows iterator must be consumed before advancing to the next cohort.
+    """
+    for cohort, rows in groupby(cohort_rows, key=lambda row: row[:3]):
+        yield cohort, iter_wide_rows(row[3:] for row in rows)
+
+
+class _ChunkBuffer:
+    """Write-only sink that hands written bytes back out in chunks"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_zip(entries):
+    """Stream a ZIP archive of (name, byte chunk iterable) entries
+
+    Entries are compressed and yielded as they are produced, so neither
+    the archive nor a whole entry is ever held in memory.
+    """
+    buffer = _ChunkBuffer()
+    with ZipFile(buffer, "w", compression=ZIP_DEFLATED) as archive:
+        for name, chunks in entries:
+            with archive.open(name, "w", force_zip64=True) as entry:
+                for chunk in chunks:
+                    entry.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+    yield buffer.drain()
+
+
+def iter_file_chunks(file, chunk_size=64 * 1024):
+    """Yield a file's contents in chunks, closing it afterwards"""
+    with file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
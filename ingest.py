@@ -0,0 +1,143 @@
+import os
+import uuid
+
+from image_to_text import extract_text_from_image
+from text_to_json import process_text_with_image
+
+IMAGE_EXTENSIONS = {"png", "jpg", "jpeg", "gif"}
+SCAN_EXTENSIONS = IMAGE_EXTENSIONS | {"pdf"}
+
+# Where PDF pages are rendered before extraction
+SCAN_TEMP_DIR = "./temp"
+# Render scale for PDF pages (1 = 72 dpi)
+PDF_RENDER_SCALE = 3
+
+
+def process_single_image(file_path):
+    """Process a single image file and return extracted data."""
+    try:
+        # Extract text from image
+        extracted_result = extract_text_from_image(file_path)
+
+        if not extracted_result or not isinstance(extracted_result, dict):
+            print(f"Invalid extraction result from {file_path}")
+            return None
+
+        # Get the extracted text from the result
+        extracted_text = extracted_result.get("text")
+        if not extracted_text:
+            print(f"No text content extracted from {file_path}")
+            return None
+
+        # Process the extracted text into structured data
+        processed_data = process_text_with_image(extracted_text, file_path)
+
+        if not processed_data:
+            print(f"Failed to process data from {file_path}")
+            return None
+
+        return validate_processed_data(processed_data)
+
+    except Exception as e:
+        print(f"Error processing {file_path}: {str(e)}")
+        return None
+
+
+def validate_processed_data(data):
+    """Validate processed data structure."""
+    if not isinstance(data, dict):
+        return None
+
+    # Ensure required fields exist
+    required_fields = ["roll_number", "questions", "total_marks"]
+    if not all(field in data for field in required_fields):
+        return None
+
+    # Validate questions structure
+    questions = data.get("questions", {})
+    if not isinstance(questions, dict):
+        return None
+
+    # Validate question data structure
+    for q_num in range(1, 7):
+        q_key = f"Q{q_num}"
+        if q_key not in questions:
+            questions[q_key] = {"a": 0, "b": 0, "c": 0, "d": 0}
+            continue
+
+        q_data = questions[q_key]
+        if not isinstance(q_data, dict) or not all(
+            part in q_data for part in ["a", "b", "c", "d"]
+        ):
+            return None
+
+        # Validate mark values
+        for part in ["a", "b", "c", "d"]:
+            mark = q_data[part]
+            if not isinstance(mark, (int, float)) or not (0 <= mark <= 8):
+                q_data[part] = 0
+
+    return data
+
+
+def is_scan(filename):
+    return "." in filename and filename.rsplit(".", 1)[1].lower() in SCAN_EXTENSIONS
+
+
+def render_pdf_pages(pdf_path, temp_dir=SCAN_TEMP_DIR):
+    """Render every page of a PDF to a PNG file; returns the page paths"""
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        raise RuntimeError("PDF scans require the pypdfium2 package")
+
+    os.makedirs(temp_dir, exist_ok=True)
+    prefix = os.path.join(temp_dir, uuid.uuid4().hex)
+    pdf = pdfium.PdfDocument(pdf_path)
+    paths = []
+    try:
+        for index in range(len(pdf)):
+            path = f"{prefix}-p{index + 1}.png"
+            pdf[index].render(scale=PDF_RENDER_SCALE).to_pil().save(path)
+            paths.append(path)
+    except Exception:
+        for path in paths:
+            os.remove(path)
+        raise
+    finally:
+        pdf.close()
+    return paths
+
+
+def process_scan(file_path):
+    """Extract the results in one scan: an image, or a PDF of one sheet per page"""
+    if not file_path.lower().endswith(".pdf"):
+        result = process_single_image(file_path)
+        return [result] if result else []
+
+    pages = render_pdf_pages(file_path)
+    try:
+        return [result for result in map(process_single_image, pages) if result]
+    finally:
+        for page in pages:
+            if os.path.exists(page):
+                os.remove(page)
+
+
+def save_scanned_results(
+    results_db, results, class_year, subject, exam_type, academic_year
+):
+    """Snap roll numbers and save extracted results for one exam
+
+    Returns (saved count, roll number report). Reads are not snapped onto
+    students who already have a result for the exam, so a misread cannot
+    overwrite another student's marks.
+    """
+    existing = results_db.get_saved_roll_numbers(
+        class_year, subject, exam_type, academic_year
+    )
+    roll_numbers = results_db.roll_numbers.resolve(results, existing)
+    saved = results_db.save_results(
+        results, class_year, subject, exam_type, academic_year
+    )
+    return saved, roll_numbers
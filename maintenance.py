@@ -0,0 +1,227 @@
+import glob
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, every process runs tasks
+    fcntl = None
+
+BACKUP_DIR = os.getenv("BACKUP_DIR", "./database/backups")
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", 3))
+# Pages copied per backup step; writers get the database between steps
+BACKUP_STEP_PAGES = int(os.getenv("BACKUP_STEP_PAGES", 1024))
+BACKUP_STEP_SLEEP = float(os.getenv("BACKUP_STEP_SLEEP", 0.05))
+
+BACKUP_INTERVAL = float(os.getenv("MAINTENANCE_BACKUP_INTERVAL", 6 * 60 * 60))
+ANALYZE_INTERVAL = float(os.getenv("MAINTENANCE_ANALYZE_INTERVAL", 24 * 60 * 60))
+VACUUM_INTERVAL = float(os.getenv("MAINTENANCE_VACUUM_INTERVAL", 60 * 60))
+# Rows sampled per index by ANALYZE, keeping it cheap on large tables
+ANALYSIS_LIMIT = 1000
+# Free pages returned to the filesystem per incremental vacuum run
+VACUUM_PAGES = 2000
+
+MAINTENANCE_LOCK_FILE = "./database/maintenance.lock"
+MAINTENANCE_ENABLED = os.getenv("MAINTENANCE_ENABLED", "1") != "0"
+
+
+def backup_database(db_file, backup_dir=BACKUP_DIR, keep=BACKUP_KEEP):
+    """Copy a live database with the online backup API
+
+    Pages are copied BACKUP_STEP_PAGES at a time with a pause in between, so
+    writers are never held off for the whole copy. The newest ``keep``
+    backups of each database are kept. Returns the backup path.
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    name = os.path.splitext(os.path.basename(db_file))[0]
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(backup_dir, f"{name}-{stamp}.db")
+    temp_path = f"{path}.tmp"
+
+    source = sqlite3.connect(f"file:{os.path.abspath(db_file)}?mode=ro", uri=True)
+    target = sqlite3.connect(temp_path)
+    try:
+        source.backup(target, pages=BACKUP_STEP_PAGES, sleep=BACKUP_STEP_SLEEP)
+    finally:
+        target.close()
+        source.close()
+    os.replace(temp_path, path)
+
+    backups = sorted(glob.glob(os.path.join(backup_dir, f"{name}-*.db")))
+    for old in backups[:-keep]:
+        os.remove(old)
+    return path
+
+
+def backup_archive(archive_path, backup_dir=BACKUP_DIR):
+    """Copy a frozen archive once; it never changes afterwards"""
+    target = os.path.join(backup_dir, "archive", os.path.basename(archive_path))
+    if not os.path.exists(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(archive_path, target)
+    return target
+
+
+def analyze(cursor):
+    """Refresh planner statistics from a bounded sample"""
+    cursor.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+    cursor.execute("ANALYZE")
+    cursor.execute("PRAGMA optimize")
+
+
+def incremental_vacuum(cursor, max_pages=VACUUM_PAGES):
+    """Release up to max_pages free pages; returns the number released
+
+    Needs auto_vacuum=INCREMENTAL. sqlite3 steps the pragma once per
+    execute and each step frees one page, hence the loop.
+    """
+    cursor.execute("PRAGMA freelist_count")
+    pages = min(cursor.fetchone()[0], max_pages)
+    for _ in range(pages):
+        cursor.execute("PRAGMA incremental_vacuum(1)")
+    return pages
+
+
+def ensure_incremental_vacuum(conn):
+    """Switch a database to auto_vacuum=INCREMENTAL (rewrites it once)"""
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+
+
+class MaintenanceScheduler:
+    """Runs periodic maintenance tasks on a background thread
+
+    Only one process per database directory runs tasks at a time (a file
+    lock decides which), so several app workers do not back up or vacuum
+    the same files concurrently. Last-run timings are kept for get_stats().
+    """
+
+    def __init__(self, lock_file=MAINTENANCE_LOCK_FILE, poll_interval=30):
+        self.lock_file = lock_file
+        self.poll_interval = poll_interval
+        self._tasks = {}
+        self._thread = None
+        self._lock = threading.Lock()
+        self._lock_handle = None
+
+    def add_task(self, name, interval, fn):
+        """Run fn every ``interval`` seconds, the first time one interval from now"""
+        self._tasks[name] = {
+            "interval": interval,
+            "fn": fn,
+            "next_due": time.time() + interval,
+            "runs": 0,
+            "last": None,
+        }
+
+    def start(self):
+        with self._lock:
+            if self._thread is None and MAINTENANCE_ENABLED:
+                self._thread = threading.Thread(
+                    target=self._loop, name="maintenance", daemon=True
+                )
+                self._thread.start()
+
+    def _holds_lock(self):
+        if fcntl is None:
+            return True
+        if self._lock_handle is None:
+            handle = open(self.lock_file, "a")
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                handle.close()
+                return False
+            self._lock_handle = handle
+        return True
+
+    def _loop(self):
+        while True:
+            if self._holds_lock():
+                now = time.time()
+                for name, task in list(self._tasks.items()):
+                    if task["next_due"] <= now:
+                        self.run(name)
+            time.sleep(self.poll_interval)
+
+    def run(self, name):
+        """Run a task now and record its timing; returns the last-run record"""
+        task = self._tasks[name]
+        started = time.time()
+        start = time.perf_counter()
+        record = {"started_at": datetime.fromtimestamp(started).isoformat()}
+        try:
+            record["result"] = task["fn"]()
+            record["status"] = "ok"
+        except Exception as e:
+            record["status"] = "error"
+            record["error"] = str(e)
+            print(f"Maintenance task {name} failed: {e}")
+        record["duration_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        with self._lock:
+            task["runs"] += 1
+            task["last"] = record
+            task["next_due"] = started + task["interval"]
+        return record
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                name: {
+                    "interval_seconds": task["interval"],
+                    "runs": task["runs"],
+                    "next_due": datetime.fromtimestamp(task["next_due"]).isoformat(),
+                    "last_run": task["last"],
+                }
+                for name, task in self._tasks.items()
+            }
+
+
+def create_scheduler(results_db, batch_store):
+    """Scheduler with backup, ANALYZE and incremental vacuum tasks
+
+    Writes to the results database go through its writer queue; the other
+    databases are small and written to directly.
+    """
+    scheduler = MaintenanceScheduler()
+    other_files = [
+        results_db.users_db_file,
+        results_db.analysis_db_file,
+        batch_store.db_file,
+    ]
+
+    def backup():
+        paths = [backup_database(path) for path in [results_db.db_file, *other_files]]
+        paths += [
+            backup_archive(path) for path in results_db.shards.frozen_years().values()
+        ]
+        return {"files": len(paths)}
+
+    def run_direct(db_file, fn):
+        conn = sqlite3.connect(db_file, isolation_level=None)
+        try:
+            return fn(conn.cursor())
+        finally:
+            conn.close()
+
+    def analyze_all():
+        results_db.writer.run(analyze)
+        for path in other_files:
+            run_direct(path, analyze)
+        return {"databases": len(other_files) + 1}
+
+    def vacuum():
+        return {
+            "results_pages": results_db.writer.run(incremental_vacuum),
+            "upload_batch_pages": run_direct(batch_store.db_file, incremental_vacuum),
+        }
+
+    scheduler.add_task("backup", BACKUP_INTERVAL, backup)
+    scheduler.add_task("analyze", ANALYZE_INTERVAL, analyze_all)
+    scheduler.add_task("incremental_vacuum", VACUUM_INTERVAL, vacuum)
+    return scheduler
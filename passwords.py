@@ -0,0 +1,177 @@
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Werkzeug method string, e.g. "pbkdf2:sha256:600000" or "scrypt:32768:8:1"
+HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "pbkdf2:sha256:600000")
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", os.cpu_count() or 2))
+# Requests allowed to wait for or run on the pool before callers are turned away
+HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", HASH_WORKERS * 8))
+HASH_WAIT_TIMEOUT = float(os.getenv("PASSWORD_HASH_WAIT_TIMEOUT", 10))
+# Workers are never forked from the app: by the time the pool starts it runs
+# the writer, maintenance and prefetch threads, and a fork could copy a lock
+# one of them holds into a child that then waits on it forever
+POOL_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing queue is full for longer than the timeout"""
+
+
+def _hash(password, method):
+    return generate_password_hash(password, method=method)
+
+
+def _check(password_hash, password):
+    return check_password_hash(password_hash, password)
+
+
+class PasswordHasher:
+    """Runs password hashing on a bounded process pool
+
+    Hashes are CPU bound, so running them in worker processes keeps the
+    request threads free; at most ``queue_limit`` hashes are queued or
+    running at once. Latency and queue depth are recorded for get_stats().
+    """
+
+    def __init__(
+        self,
+        method=HASH_METHOD,
+        workers=HASH_WORKERS,
+        queue_limit=HASH_QUEUE_LIMIT,
+        wait_timeout=HASH_WAIT_TIMEOUT,
+    ):
+        self.method = method
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.wait_timeout = wait_timeout
+        self._slots = threading.BoundedSemaphore(queue_limit)
+        self._pool = None
+        self._lock = threading.Lock()
+        self._method_prefix = None
+
+        self._in_flight = 0
+        self._max_in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._rehashed = 0
+        self._latencies = deque(maxlen=1000)
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=POOL_CONTEXT
+                )
+            return self._pool
+
+    def _discard_pool(self):
+        # A worker died: start a fresh pool next time
+        with self._lock:
+            self._pool = None
+
+    @contextmanager
+    def _slot(self, count=1):
+        """Hold a queue slot for a job of count hashes and record its latency"""
+        if not self._slots.acquire(timeout=self.wait_timeout):
+            with self._lock:
+                self._rejected += 1
+            raise HashingBusy("Password hashing queue is full")
+
+        with self._lock:
+            self._in_flight += 1
+            self._max_in_flight = max(self._max_in_flight, self._in_flight)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._in_flight -= 1
+                self._completed += count
+                # Record the per-hash cost so batches do not skew latency
+                self._latencies.append(elapsed / count)
+            self._slots.release()
+
+    def _run(self, fn, *args):
+        with self._slot():
+            try:
+                return self._get_pool().submit(fn, *args).result()
+            except BrokenProcessPool:
+                self._discard_pool()
+                return fn(*args)
+
+    def hash(self, password):
+        """Hash a password with the configured method"""
+        return self._run(_hash, password, self.method)
+
+    def hash_many(self, passwords):
+        """Hash a list of passwords in parallel across all pool workers
+
+        The whole list counts as one queued job; it is split into chunks so
+        every worker stays busy.
+        """
+        if not passwords:
+            return []
+        chunksize = max(1, len(passwords) // (self.workers * 4))
+        methods = [self.method] * len(passwords)
+        with self._slot(len(passwords)):
+            try:
+                pool = self._get_pool()
+                return list(pool.map(_hash, passwords, methods, chunksize=chunksize))
+            except BrokenProcessPool:
+                self._discard_pool()
+                return list(map(_hash, passwords, methods))
+
+    def verify(self, password_hash, password):
+        """Check a password; returns (valid, needs_rehash)"""
+        valid = self._run(_check, password_hash, password)
+        return valid, valid and self.needs_rehash(password_hash)
+
+    def needs_rehash(self, password_hash):
+        """Whether a stored hash uses other parameters than the configured ones"""
+        if self._method_prefix is None:
+            # Expand short names ("scrypt") into the full stored prefix once
+            self._method_prefix = _hash("", self.method).split("$", 1)[0]
+        return password_hash.split("$", 1)[0] != self._method_prefix
+
+    def record_rehash(self):
+        with self._lock:
+            self._rehashed += 1
+
+    def get_stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = {
+                "method": self.method,
+                "workers": self.workers,
+                "queue_limit": self.queue_limit,
+                "queue_depth": self._in_flight,
+                "max_queue_depth": self._max_in_flight,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "rehashed": self._rehashed,
+            }
+        if latencies:
+            stats["latency_ms"] = {
+                "average": round(sum(latencies) / len(latencies) * 1000, 2),
+                "p95": round(
+                    latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+                    * 1000,
+                    2,
+                ),
+                "max": round(latencies[-1] * 1000, 2),
+            }
+        return stats
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,260 @@
+from itertools import islice
+
+import numpy as np
+
+PARTS = ("a", "b", "c", "d")
+QUESTION_COUNT = 6
+MARK_COLUMNS = [f"Q{q}{part}" for q in range(1, QUESTION_COUNT + 1) for part in PARTS]
+
+# Long rows pivoted per step by iter_mark_matrices (6 rows per result)
+PIVOT_CHUNK_ROWS = 6 * 4096
+
+# Packed marks: every part mark as a 4-bit value in MARK_COLUMNS order, two
+# per byte with the high nibble first, so hex() of a packed blob has one
+# digit per part mark
+PACKED_MARKS_SIZE = len(MARK_COLUMNS) // 2
+PACKED_MARK_MAX = 15
+
+
+class MarkMatrix:
+    """Marks pivoted to wide form: one row per result, Q x parts per row
+
+    The same buffer backs the JSON shape (to_records) and the tabular
+    export shape (iter_rows).
+    """
+
+    def __init__(self, roll_numbers, totals, marks):
+        self.roll_numbers = roll_numbers
+        self.totals = totals
+        self.marks = marks
+
+    def __len__(self):
+        return len(self.roll_numbers)
+
+    def to_records(self, subject=None):
+        """Return the /api/view-marks JSON shape"""
+        offsets = [
+            (f"Q{q_index + 1}", q_index * len(PARTS))
+            for q_index in range(QUESTION_COUNT)
+        ]
+        flat = self.marks.reshape(len(self), len(MARK_COLUMNS)).tolist()
+        return [
+            {
+                "roll_number": roll_number,
+                "subject": subject,
+                "total_marks": total_marks,
+                "questions": {
+                    name: {
+                        "a": marks[i],
+                        "b": marks[i + 1],
+                        "c": marks[i + 2],
+                        "d": marks[i + 3],
+                    }
+                    for name, i in offsets
+                },
+            }
+            for roll_number, total_marks, marks in zip(
+                self.roll_numbers.tolist(), self.totals.tolist(), flat
+            )
+        ]
+
+    def iter_rows(self):
+        """Yield (roll_number, total_marks, marks) in MARK_COLUMNS order"""
+        flat = self.marks.reshape(len(self), len(MARK_COLUMNS))
+        return zip(self.roll_numbers.tolist(), self.totals.tolist(), flat.tolist())
+
+
+def group_starts(*key_columns):
+    """Return (group index per row, first row of each group) for sorted keys"""
+    changed = np.zeros(len(key_columns[0]) - 1, dtype=bool)
+    for column in key_columns:
+        changed |= column[1:] != column[:-1]
+    starts = np.flatnonzero(np.r_[True, changed])
+    groups = np.r_[0, np.cumsum(changed)]
+    return groups, starts
+
+
+def scatter_marks(groups, question_numbers, part_columns, student_count):
+    """Scatter long (student, question) rows into a students x Q x parts array"""
+    marks = np.zeros((student_count, QUESTION_COUNT, len(PARTS)))
+    present = np.not_equal(question_numbers, None)
+    rows = groups[present]
+    questions = question_numbers[present].astype(int) - 1
+    values = np.array(part_columns[present], dtype=float)
+    marks[rows, questions] = np.nan_to_num(values)
+    return marks
+
+
+def empty_mark_matrix():
+    return MarkMatrix(
+        np.array([], dtype=object),
+        np.zeros(0),
+        np.zeros((0, QUESTION_COUNT, len(PARTS))),
+    )
+
+
+def pack_marks(marks):
+    """Pack a results x Q x parts array into PACKED_MARKS_SIZE-byte blobs
+
+    Returns one blob per result, or None for a result with a mark that is
+    not a whole number from 0 to PACKED_MARK_MAX.
+    """
+    flat = np.asarray(marks, dtype=float).reshape(-1, len(MARK_COLUMNS))
+    fits = np.all(
+        (flat == np.round(flat)) & (flat >= 0) & (flat <= PACKED_MARK_MAX), axis=1
+    )
+    nibbles = np.where(fits[:, None], flat, 0).astype(np.uint8)
+    packed = (nibbles[:, 0::2] << 4) | nibbles[:, 1::2]
+    return [row.tobytes() if ok else None for row, ok in zip(packed, fits)]
+
+
+def unpack_marks(blobs):
+    """Decode packed blobs back into a results x Q x parts float array"""
+    packed = np.frombuffer(b"".join(blobs), dtype=np.uint8).reshape(
+        -1, PACKED_MARKS_SIZE
+    )
+    nibbles = np.empty((len(packed), len(MARK_COLUMNS)), dtype=np.uint8)
+    nibbles[:, 0::2] = packed >> 4
+    nibbles[:, 1::2] = packed & 0x0F
+    return nibbles.reshape(-1, QUESTION_COUNT, len(PARTS)).astype(float)
+
+
+def build_mark_matrix(rows):
+    """Pivot long rows shaped like ResultsDatabase.iter_mark_rows in one step
+
+    rows must be ordered by result; every result becomes one matrix row.
+    A result stored packed arrives as a single row carrying its blob in a
+    ninth column and is decoded instead of scattered.
+    """
+    if not rows:
+        return empty_mark_matrix()
+
+    data = np.array(rows, dtype=object)
+    groups, starts = group_starts(data[:, 0])
+    marks = scatter_marks(groups, data[:, 3], data[:, 4:8], len(starts))
+    if data.shape[1] > 8:
+        blobs = data[starts, 8]
+        packed = np.not_equal(blobs, None)
+        if packed.any():
+            marks[packed] = unpack_marks(blobs[packed])
+    return MarkMatrix(data[starts, 1], data[starts, 2].astype(float), marks)
+
+
+def iter_mark_matrices(mark_rows, chunk_rows=PIVOT_CHUNK_ROWS):
+    """Pivot a stream of long rows chunk by chunk
+
+    Each chunk is pivoted with build_mark_matrix; rows of the last result
+    in a chunk are held back until the next one so no result is split.
+    Memory stays bounded by the chunk size however long the stream is.
+    """
+    mark_rows = iter(mark_rows)
+    carry = []
+    while True:
+        chunk = carry + list(islice(mark_rows, chunk_rows))
+        if len(chunk) == len(carry):
+            break
+
+        last_id = chunk[-1][0]
+        split = len(chunk)
+        while split > 0 and chunk[split - 1][0] == last_id:
+            split -= 1
+        if split == 0:
+            # One result larger than a chunk: keep reading until it ends
+            carry = chunk
+            continue
+
+        carry = chunk[split:]
+        yield build_mark_matrix(chunk[:split])
+
+    if carry:
+        yield build_mark_matrix(carry)
+
+
+def matrix_from_results(entries):
+    """Build a MarkMatrix from extracted result dicts (upload batches)"""
+    if not entries:
+        return empty_mark_matrix()
+
+    marks = np.array(
+        [
+            [
+                [
+                    entry.get("questions", {}).get(f"Q{q}", {}).get(part, 0)
+                    for part in PARTS
+                ]
+                for q in range(1, QUESTION_COUNT + 1)
+            ]
+            for entry in entries
+        ],
+        dtype=float,
+    )
+    return MarkMatrix(
+        np.array([entry.get("roll_number", "") for entry in entries], dtype=object),
+        np.array([entry.get("total_marks", 0) for entry in entries], dtype=float),
+        marks,
+    )
+
+
+def _benchmark(student_count):
+    """Time the old row-by-row dict pivot against build_mark_matrix"""
+    import random
+    import time
+
+    rng = random.Random(0)
+    rows = [
+        (
+            result_id,
+            f"A{result_id:011d}",
+            20.0,
+            q_num,
+            *[float(rng.randint(0, 8)) for _ in PARTS],
+        )
+        for result_id in range(student_count)
+        for q_num in range(1, QUESTION_COUNT + 1)
+    ]
+
+    start = time.perf_counter()
+    results = {}
+    for row in rows:
+        roll_number = row[1]
+        if roll_number not in results:
+            results[roll_number] = {
+                "roll_number": roll_number,
+                "subject": "java",
+                "total_marks": row[2],
+                "questions": {},
+            }
+        results[roll_number]["questions"][f"Q{row[3]}"] = dict(zip(PARTS, row[4:8]))
+    list(results.values())
+    dict_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matrix = build_mark_matrix(rows)
+    pivot_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matrix.to_records("java")
+    records_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in matrix.iter_rows():
+        pass
+    rows_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for chunk in iter_mark_matrices(iter(rows)):
+        for _ in chunk.iter_rows():
+            pass
+    streamed_time = time.perf_counter() - start
+
+    print(
+        f"{student_count:>7} students: dict pivot {dict_time * 1000:8.1f} ms | "
+        f"vectorized pivot {pivot_time * 1000:7.1f} ms, "
+        f"+JSON {records_time * 1000:7.1f} ms, +rows {rows_time * 1000:6.1f} ms | "
+        f"chunked pivot+rows {streamed_time * 1000:7.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    for count in (1_000, 10_000, 50_000):
+        _benchmark(count)
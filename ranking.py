@@ -0,0 +1,165 @@
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+
+
+class CohortRanking:
+    """Results of one cohort kept sorted by total marks
+
+    Entries are (-total_marks, roll_number, academic_year) tuples in a sorted
+    list, so the best result comes first. Rank, percentile and count lookups
+    are a bisect, O(log n); top-k and bottom-k are O(log n + k). Inserting or
+    removing a result is a bisect plus a list shift, O(n), which for a
+    cohort of a few thousand results is a short memmove.
+    """
+
+    def __init__(self, rows=()):
+        self._entries = []
+        self._scores = []
+        self._by_roll = {}
+        self._marks_sum = 0.0
+        for roll_number, academic_year, total_marks in rows:
+            self.set(roll_number, academic_year, total_marks)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def set(self, roll_number, academic_year, total_marks):
+        """Insert a result, or move it if the student's total changed"""
+        self.remove(roll_number, academic_year)
+        total_marks = float(total_marks)
+        insort(self._entries, (-total_marks, roll_number, academic_year))
+        insort(self._scores, -total_marks)
+        self._by_roll.setdefault(roll_number, {})[academic_year] = total_marks
+        self._marks_sum += total_marks
+
+    def remove(self, roll_number, academic_year):
+        years = self._by_roll.get(roll_number)
+        if not years or academic_year not in years:
+            return
+        total_marks = years.pop(academic_year)
+        if not years:
+            del self._by_roll[roll_number]
+        index = bisect_left(self._entries, (-total_marks, roll_number, academic_year))
+        del self._entries[index]
+        del self._scores[bisect_left(self._scores, -total_marks)]
+        self._marks_sum -= total_marks
+
+    def average(self):
+        return self._marks_sum / len(self._entries) if self._entries else 0
+
+    def top(self, k):
+        """Best k results, highest marks first"""
+        return [self._entry(entry) for entry in self._entries[:k]]
+
+    def bottom(self, k, below=None):
+        """Worst k results, lowest marks first, optionally under a cutoff"""
+        end = len(self._entries)
+        count = end if below is None else self.count_below(below)
+        return [
+            self._entry(entry)
+            for entry in reversed(self._entries[end - min(k, count) : end])
+        ]
+
+    def count_below(self, total_marks):
+        """Number of results strictly below total_marks"""
+        return len(self._scores) - bisect_right(self._scores, -float(total_marks))
+
+    def rank(self, total_marks):
+        """Competition rank (1 = best) of a total within the cohort"""
+        return bisect_left(self._scores, -float(total_marks)) + 1
+
+    def percentile(self, total_marks):
+        """Share of the rest of the cohort scoring strictly lower, as a percent"""
+        if len(self._scores) < 2:
+            return 0.0
+        return round(self.count_below(total_marks) / (len(self._scores) - 1) * 100, 1)
+
+    def standing(self, roll_number):
+        """Rank and percentile of each of a student's results in the cohort"""
+        return [
+            {
+                "roll_number": roll_number,
+                "academic_year": academic_year,
+                "marks": total_marks,
+                "rank": self.rank(total_marks),
+                "cohort_size": len(self._entries),
+                "percentile": self.percentile(total_marks),
+            }
+            for academic_year, total_marks in sorted(
+                self._by_roll.get(roll_number, {}).items()
+            )
+        ]
+
+    @staticmethod
+    def _entry(entry):
+        return {"roll_number": entry[1], "marks": -entry[0]}
+
+
+class RankIndex:
+    """Per-cohort rankings kept in step with the cohort data version
+
+    Writers apply their changes as they commit; a ranking whose version has
+    been moved by anyone else (another process, a rebuilt table) is reloaded
+    in full on its next read.
+    """
+
+    def __init__(self, max_cohorts=64):
+        self.max_cohorts = max_cohorts
+        self._cohorts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def query(self, cohort, stamp, loader, reader):
+        """Run reader on a cohort's ranking, rebuilding it if stamp moved
+
+        loader returns (roll_number, academic_year, total_marks) rows; reader
+        runs under the index lock so concurrent writers cannot interleave.
+        """
+        with self._lock:
+            entry = self._cohorts.get(cohort)
+            if entry and entry["stamp"] == stamp:
+                self._cohorts.move_to_end(cohort)
+                return reader(entry["ranking"])
+
+        ranking = CohortRanking(loader())
+        with self._lock:
+            self._cohorts[cohort] = {
+                "version": int(stamp.split("@", 1)[0]),
+                "stamp": stamp,
+                "ranking": ranking,
+            }
+            self._cohorts.move_to_end(cohort)
+            while len(self._cohorts) > self.max_cohorts:
+                self._cohorts.popitem(last=False)
+            return reader(ranking)
+
+    def apply(self, cohort, stamp, changes):
+        """Apply a committed write to a cached ranking
+
+        changes is a list of (roll_number, academic_year, total_marks) with
+        total_marks None for a deleted result. If the write was not the next
+        version after the cached one, or a total is not a number, the ranking
+        is dropped instead; callers have already committed, so this never
+        raises for bad totals.
+        """
+        version = int(stamp.split("@", 1)[0])
+        with self._lock:
+            entry = self._cohorts.get(cohort)
+            if not entry:
+                return
+            if entry["version"] != version - 1:
+                del self._cohorts[cohort]
+                return
+            ranking = entry["ranking"]
+            try:
+                for roll_number, academic_year, total_marks in changes:
+                    if total_marks is None:
+                        ranking.remove(roll_number, academic_year)
+                    else:
+                        ranking.set(roll_number, academic_year, total_marks)
+            except (TypeError, ValueError):
+                # The write is already committed; reload on the next read
+                del self._cohorts[cohort]
+                return
+            entry["version"] = version
+            entry["stamp"] = stamp
@@ -0,0 +1,90 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+READ_POOL_SIZE = int(os.getenv("RESULTS_READ_POOL_SIZE", 8))
+
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection that can carry bookkeeping attributes"""
+
+
+class ReadPool:
+    """Pool of read-only connections for analytics and exports
+
+    Each borrowed connection runs inside one read transaction, so every
+    query of a request sees the same WAL snapshot and never waits for the
+    writer. ``size`` connections are kept; extra borrowers get a fresh
+    connection that is closed when returned.
+    """
+
+    def __init__(self, connect, size=READ_POOL_SIZE, is_current=None):
+        self._connect = connect
+        # Called on borrow; a pooled connection it rejects is reopened
+        self._is_current = is_current
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._borrowed = 0
+        self._max_borrowed = 0
+
+    def _acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+        if conn is not None and self._is_current and not self._is_current(conn):
+            conn.close()
+            conn = None
+        if conn is None:
+            conn = self._connect()
+            with self._lock:
+                self._opened += 1
+        return conn
+
+    def _release(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection holding a read snapshot for the block"""
+        conn = self._acquire()
+        with self._lock:
+            self._borrowed += 1
+            self._max_borrowed = max(self._max_borrowed, self._borrowed)
+        try:
+            conn.execute("BEGIN")
+            yield conn
+        finally:
+            with self._lock:
+                self._borrowed -= 1
+            try:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                conn.close()
+            else:
+                self._release(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "idle": self._idle.qsize(),
+                "borrowed": self._borrowed,
+                "max_borrowed": self._max_borrowed,
+                "opened": self._opened,
+            }
@@ -0,0 +1,224 @@
+import sqlite3
+import threading
+import time
+
+# Letters OCR commonly reads in place of a digit
+OCR_CONFUSABLES = str.maketrans("ODQILZSGBT", "0001125687")
+
+
+def normalize_roll_number(roll_number):
+    """Upper-case a roll number and drop any whitespace in it"""
+    return "".join(str(roll_number).split()).upper()
+
+
+def fold_confusables(roll_number):
+    """Map letters that look like digits to those digits"""
+    return roll_number.translate(OCR_CONFUSABLES)
+
+
+def deletions(word):
+    """Every string made by removing one character from word"""
+    return {word[:i] + word[i + 1 :] for i in range(len(word))}
+
+
+def within_one_edit(a, b):
+    """Whether a and b differ by at most one insertion, deletion or substitution"""
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return a[i + 1 :] == b[i + 1 :]
+    return a[i:] == b[i + 1 :]
+
+
+class RollNumberIndex:
+    """Matches roll numbers read by OCR against registered students
+
+    A read that is not a registered ID is first looked up with look-alike
+    letters folded to digits (A2312655I134 -> A23126551134), then by edit
+    distance. For the latter every student ID is indexed under each of its
+    one-character deletions, so an ID one insertion, deletion or
+    substitution away from the read shares a key with it and a lookup is a
+    dozen dict probes. Students registered since the last lookup batch, by
+    any process, are added incrementally by rowid.
+
+    Roll numbers are normalized only to build lookup keys; matches are
+    reported with the ID exactly as the students table stores it.
+    """
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+        # Normalized ID -> ID as stored
+        self._ids = {}
+        self._folded = {}
+        self._keys = {}
+        # (row count, max rowid) of the students table already indexed
+        self._indexed = (0, 0)
+        self._lock = threading.Lock()
+        self._lookups = 0
+        self._lookup_time = 0.0
+        self._counts = {}
+
+    def add(self, student_id):
+        with self._lock:
+            self._add(student_id)
+
+    def _add(self, student_id):
+        normalized = normalize_roll_number(student_id)
+        if normalized in self._ids:
+            return
+        self._ids[normalized] = student_id
+        self._folded.setdefault(fold_confusables(normalized), set()).add(normalized)
+        for key in deletions(normalized) | {normalized}:
+            self._keys.setdefault(key, set()).add(normalized)
+
+    def refresh(self):
+        """Index students added since the last refresh
+
+        The index is rebuilt instead when students were removed.
+        """
+        conn = sqlite3.connect(self.db_file)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*), COALESCE(MAX(rowid), 0) FROM students")
+            indexed = cursor.fetchone()
+            with self._lock:
+                if indexed == self._indexed:
+                    return
+                cursor.execute(
+                    "SELECT id FROM students WHERE rowid > ?", (self._indexed[1],)
+                )
+                rows = cursor.fetchall()
+                if self._indexed[0] + len(rows) != indexed[0]:
+                    self._ids.clear()
+                    self._folded.clear()
+                    self._keys.clear()
+                    cursor.execute("SELECT id FROM students")
+                    rows = cursor.fetchall()
+                for (student_id,) in rows:
+                    self._add(student_id)
+                self._indexed = indexed
+        finally:
+            conn.close()
+
+    def match(self, roll_number):
+        """Match one read roll number against the index as it stands
+
+        Returns {"status", "read_as", "roll_number", "candidates"}. status is
+        "exact" for a registered ID as stored, "snapped" when exactly one
+        student matches up to case and whitespace, with look-alike letters
+        folded or, failing that, one edit away (roll_number is then theirs), "ambiguous" when several are and
+        "unknown" when none is. Candidates are IDs as stored; read_as is the
+        roll number as given.
+        """
+        start = time.perf_counter()
+        normalized = normalize_roll_number(roll_number)
+        with self._lock:
+            stored = self._ids.get(normalized)
+            folded = self._folded.get(fold_confusables(normalized), ())
+            if stored is not None:
+                matches = [normalized]
+            elif len(folded) == 1:
+                matches = list(folded)
+            else:
+                found = set()
+                for key in deletions(normalized) | {normalized}:
+                    found.update(self._keys.get(key, ()))
+                matches = sorted(
+                    student_id
+                    for student_id in found
+                    if within_one_edit(normalized, student_id)
+                )
+            candidates = [self._ids[student_id] for student_id in matches]
+            self._lookups += 1
+            self._lookup_time += time.perf_counter() - start
+
+        if stored is not None and stored == str(roll_number):
+            status = "exact"
+        elif len(candidates) == 1:
+            status = "snapped"
+        elif candidates:
+            status = "ambiguous"
+        else:
+            status = "unknown"
+        return {
+            "status": status,
+            "read_as": roll_number,
+            "roll_number": candidates[0] if len(candidates) == 1 else roll_number,
+            "candidates": candidates,
+        }
+
+    def resolve(self, entries, saved=()):
+        """Snap the roll numbers of a batch of extracted results in place
+
+        A near miss is rewritten to the stored ID of the student it matches
+        unless another entry of the batch already has that roll number, or
+        the student is in saved (roll numbers that already have a result
+        for the exam); it is then left as read with status "conflict", so
+        the stored result is not overwritten. Other roll numbers are
+        never rewritten. Entries that did not match exactly get
+        a "roll_number_check" record. Returns per-status counts and the
+        snapped, ambiguous and conflicting checks.
+        """
+        self.refresh()
+        matches = [
+            (entry, self.match(entry["roll_number"]))
+            for entry in entries
+            if entry.get("roll_number")
+        ]
+        claimed = set(saved)
+        claimed.update(
+            match["roll_number"] for _, match in matches if match["status"] == "exact"
+        )
+
+        report = {
+            status: 0
+            for status in ("exact", "snapped", "ambiguous", "conflict", "unknown")
+        }
+        report["flagged"] = []
+        for entry, match in matches:
+            if match["status"] == "snapped":
+                if match["roll_number"] in claimed:
+                    match["status"] = "conflict"
+                    match["roll_number"] = match["read_as"]
+                else:
+                    claimed.add(match["roll_number"])
+
+            if match["status"] == "snapped":
+                entry["roll_number"] = match["roll_number"]
+            report[match["status"]] += 1
+            if match["status"] == "exact":
+                continue
+            entry["roll_number_check"] = {
+                "status": match["status"],
+                "read_as": match["read_as"],
+                "candidates": match["candidates"],
+            }
+            if match["status"] != "unknown":
+                report["flagged"].append(
+                    {"roll_number": match["roll_number"], **entry["roll_number_check"]}
+                )
+
+        with self._lock:
+            for status, count in report.items():
+                if status != "flagged":
+                    self._counts[status] = self._counts.get(status, 0) + count
+        return report
+
+    def get_stats(self):
+        with self._lock:
+            stats = {
+                "students": len(self._ids),
+                "keys": len(self._keys),
+                "lookups": self._lookups,
+                "matches": dict(self._counts),
+            }
+            if self._lookups:
+                stats["average_lookup_us"] = round(
+                    self._lookup_time / self._lookups * 1e6, 2
+                )
+            return stats
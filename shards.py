@@ -0,0 +1,232 @@
+import os
+import re
+import sqlite3
+import time
+
+ARCHIVE_DIR = "./database/archive"
+# Archives are only ever scanned, so large pages mean fewer page reads
+ARCHIVE_PAGE_SIZE = 65536
+ARCHIVE_MMAP_SIZE = 256 * 1024 * 1024
+# Tables split by academic_year; everything else stays in the live store
+SHARDED_TABLES = ("students_results", "question_marks")
+# Views over the sharded tables, copied into archives and fanned out alike
+SHARDED_VIEWS = ("all_question_marks",)
+
+
+def archive_schema_name(index):
+    return f"shard_{index}"
+
+
+class ShardRouter:
+    """Routes results by academic_year between the live store and archives
+
+    Open years live in the main results database. A closed year can be
+    frozen into its own read-only SQLite file; attach() then mounts every
+    archive on a read connection behind TEMP views named like the sharded
+    tables, so unqualified queries fan out across all years.
+    """
+
+    def __init__(self, db_file, archive_dir=ARCHIVE_DIR, reserved_attachments=2):
+        self.db_file = db_file
+        self.archive_dir = archive_dir
+        # Attachment slots kept free for the users and analysis stores
+        self.reserved_attachments = reserved_attachments
+
+    @staticmethod
+    def create_registry(cursor):
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS results_shards (
+                academic_year TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                result_count INTEGER NOT NULL,
+                frozen_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """
+        )
+
+    def frozen_years(self, conn=None):
+        """Map of frozen academic_year -> archive path"""
+        own = conn is None
+        conn = conn or sqlite3.connect(self.db_file)
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT academic_year, path FROM main.results_shards ORDER BY academic_year"
+            )
+            return dict(cursor.fetchall())
+        finally:
+            if own:
+                conn.close()
+
+    def max_archives(self, conn):
+        return conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) - self.reserved_attachments
+
+    def attach(self, conn):
+        """Mount every archive read-only and shadow the sharded tables
+
+        conn must have been opened with uri=True.
+        """
+        paths = sorted(set(self.frozen_years(conn).values()))
+        if not paths:
+            return conn
+
+        cursor = conn.cursor()
+        schemas = []
+        for index, path in enumerate(paths):
+            schema = archive_schema_name(index)
+            # immutable: archives never change, so skip locking entirely
+            cursor.execute(
+                f"ATTACH DATABASE ? AS {schema}",
+                (f"file:{os.path.abspath(path)}?mode=ro&immutable=1",),
+            )
+            cursor.execute(f"PRAGMA {schema}.mmap_size = {ARCHIVE_MMAP_SIZE}")
+            schemas.append(schema)
+
+        for table in SHARDED_TABLES + SHARDED_VIEWS:
+            parts = [f"SELECT * FROM main.{table}"] + [
+                f"SELECT * FROM {schema}.{table}" for schema in schemas
+            ]
+            cursor.execute(f"CREATE TEMP VIEW {table} AS " + " UNION ALL ".join(parts))
+        return conn
+
+    def freeze(self, academic_year, writer):
+        """Move an academic year out of the live store into a frozen archive
+
+        The archive is built from a snapshot, then the registry entry and the
+        removal of the live rows are committed through the writer only if
+        the year did not change in the meantime. Returns the number of
+        results archived.
+        """
+        if not re.fullmatch(r"[\w-]+", academic_year):
+            raise ValueError(f"Invalid academic year: {academic_year}")
+
+        live = sqlite3.connect(self.db_file)
+        try:
+            if academic_year in self.frozen_years(live):
+                raise ValueError(f"Academic year {academic_year} is already frozen")
+            if len(self.frozen_years(live)) >= self.max_archives(live):
+                raise ValueError("No attachment slots left for another archive")
+            checksum = self._checksum(live.cursor(), "main", academic_year)
+            if not checksum[0]:
+                raise ValueError(f"No results for academic year {academic_year}")
+        finally:
+            live.close()
+
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = os.path.join(self.archive_dir, f"results_{academic_year}.db")
+        temp_path = f"{path}.{int(time.time())}.tmp"
+        try:
+            self._build_archive(temp_path, academic_year)
+            archive = sqlite3.connect(temp_path)
+            try:
+                archived = self._checksum(archive.cursor(), "main", academic_year)
+            finally:
+                archive.close()
+            if archived != checksum:
+                raise RuntimeError(
+                    f"Results for {academic_year} changed while archiving"
+                )
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        os.chmod(temp_path, 0o444)
+        os.replace(temp_path, path)
+
+        def job(cursor):
+            if self._checksum(cursor, "main", academic_year) != checksum:
+                raise RuntimeError(
+                    f"Results for {academic_year} changed while archiving"
+                )
+            cursor.execute(
+                """
+                INSERT INTO results_shards (academic_year, path, result_count)
+                VALUES (?, ?, ?)
+            """,
+                (academic_year, path, checksum[0]),
+            )
+            cursor.execute(
+                """
+                DELETE FROM question_marks WHERE result_id IN (
+                    SELECT id FROM students_results WHERE academic_year = ?
+                )
+            """,
+                (academic_year,),
+            )
+            cursor.execute(
+                "DELETE FROM students_results WHERE academic_year = ?",
+                (academic_year,),
+            )
+
+        try:
+            writer.run(job)
+        except Exception:
+            os.remove(path)
+            raise
+        return checksum[0]
+
+    def _build_archive(self, path, academic_year):
+        conn = sqlite3.connect(path, isolation_level=None)
+        try:
+            conn.execute(f"PRAGMA page_size = {ARCHIVE_PAGE_SIZE}")
+            conn.execute("PRAGMA journal_mode = OFF")
+            conn.execute("ATTACH DATABASE ? AS live", (self.db_file,))
+            cursor = conn.cursor()
+
+            # Same tables, indexes and views as the live store
+            relations = SHARDED_TABLES + SHARDED_VIEWS
+            placeholders = ", ".join("?" for _ in relations)
+            cursor.execute(
+                f"""
+                SELECT sql FROM live.sqlite_master
+                WHERE tbl_name IN ({placeholders}) AND sql IS NOT NULL
+                ORDER BY type = 'view', type = 'index'
+            """,
+                relations,
+            )
+            for (sql,) in cursor.fetchall():
+                cursor.execute(sql)
+            cursor.execute("BEGIN")
+            cursor.execute(
+                """
+                INSERT INTO main.students_results
+                SELECT * FROM live.students_results WHERE academic_year = ?
+                ORDER BY class_year, subject, exam_type, roll_number
+            """,
+                (academic_year,),
+            )
+            cursor.execute(
+                """
+                INSERT INTO main.question_marks
+                SELECT qm.* FROM live.question_marks qm
+                JOIN main.students_results sr ON sr.id = qm.result_id
+                ORDER BY qm.result_id, qm.question_number
+            """
+            )
+            cursor.execute("COMMIT")
+            cursor.execute("DETACH DATABASE live")
+            cursor.execute("ANALYZE")
+            # Rewrites the file with the archive page size, densely packed
+            cursor.execute("VACUUM")
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _checksum(cursor, schema, academic_year):
+        cursor.execute(
+            f"""
+            SELECT COUNT(*), TOTAL(sr.total_marks), MAX(sr.id),
+                (SELECT COUNT(*) FROM {schema}.question_marks qm
+                 JOIN {schema}.students_results s2 ON s2.id = qm.result_id
+                 WHERE s2.academic_year = ?),
+                (SELECT TOTAL(qm.part_a + qm.part_b + qm.part_c + qm.part_d)
+                 FROM {schema}.all_question_marks qm
+                 JOIN {schema}.students_results s2 ON s2.id = qm.result_id
+                 WHERE s2.academic_year = ?)
+            FROM {schema}.students_results sr
+            WHERE sr.academic_year = ?
+        """,
+            (academic_year, academic_year, academic_year),
+        )
+        return cursor.fetchone()
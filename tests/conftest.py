@@ -0,0 +1,34 @@
+import sqlite3
+
+import pytest
+
+from database import Database, ResultsDatabase
+
+
+def make_students(db_file, ids):
+    with sqlite3.connect(db_file) as conn:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS students "
+            "(id TEXT PRIMARY KEY, full_name TEXT, department TEXT)"
+        )
+        conn.executemany("INSERT INTO students (id) VALUES (?)", [(i,) for i in ids])
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Run each test in its own directory, away from ./database"""
+    monkeypatch.chdir(tmp_path)
+
+
+@pytest.fixture
+def results_db(tmp_path):
+    """A results store with empty students and analysis stores beside it"""
+    users_db_file = str(tmp_path / "education.db")
+    make_students(users_db_file, [])
+    analysis_db_file = str(tmp_path / "exam_analysis.db")
+    Database(db_file=analysis_db_file)
+    return ResultsDatabase(
+        db_file=str(tmp_path / "exam_results.db"),
+        users_db_file=users_db_file,
+        analysis_db_file=analysis_db_file,
+    )
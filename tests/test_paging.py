@@ -0,0 +1,68 @@
+import pytest
+
+import database
+
+COHORT = ("FY", "java", "MID1")
+
+
+def save(results_db, roll_numbers, academic_year, marks):
+    questions = {f"Q{q}": {p: marks for p in "abcd"} for q in range(1, 7)}
+    results_db.save_results(
+        [
+            {"roll_number": roll, "questions": questions, "total_marks": marks * 24}
+            for roll in roll_numbers
+        ],
+        *COHORT,
+        academic_year,
+    )
+
+
+def all_pages(results_db, limit):
+    rows, after, pages = [], None, 0
+    while True:
+        page, after = results_db.get_mark_rows_page(*COHORT, after=after, limit=limit)
+        rows.extend(page)
+        pages += 1
+        if after is None:
+            return rows, pages
+
+
+@pytest.fixture
+def cohort(results_db, monkeypatch):
+    roll_numbers = [f"A{i:03d}" for i in range(23)]
+    monkeypatch.setattr(database, "PACKED_MARKS", True)
+    save(results_db, roll_numbers, "2023", 1)
+    # Half marks are stored as question rows; some students sit the exam in
+    # two academic years, so a roll number spans several results
+    monkeypatch.setattr(database, "PACKED_MARKS", False)
+    save(results_db, roll_numbers[::3], "2024", 1.5)
+    return results_db, roll_numbers
+
+
+@pytest.mark.parametrize("limit", [1, 2, 4, 7, 22, 23, 100])
+def test_pages_cover_every_row_once(cohort, limit):
+    results_db, roll_numbers = cohort
+    rows, pages = all_pages(results_db, limit)
+
+    assert sorted(rows) == sorted(results_db.get_mark_rows(*COHORT))
+    assert len(rows) == len(set(rows))
+    assert pages == max(1, -(-len(roll_numbers) // limit))
+
+
+def test_a_students_results_stay_on_one_page(cohort):
+    results_db, roll_numbers = cohort
+    after = None
+    seen = []
+    while True:
+        page, after = results_db.get_mark_rows_page(*COHORT, after=after, limit=3)
+        page_rolls = sorted({row[1] for row in page})
+        assert not set(page_rolls) & set(seen)
+        seen.extend(page_rolls)
+        if after is None:
+            break
+        assert after == page_rolls[-1]
+    assert seen == roll_numbers
+
+
+def test_empty_cohort_is_one_empty_page(results_db):
+    assert results_db.get_mark_rows_page(*COHORT) == ([], None)
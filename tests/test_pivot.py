@@ -0,0 +1,76 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+import database
+from pivot import (
+    MARK_COLUMNS,
+    PACKED_MARKS_SIZE,
+    QUESTION_COUNT,
+    PARTS,
+    build_mark_matrix,
+    pack_marks,
+    unpack_marks,
+)
+
+
+def marks_array(*values):
+    return np.array(values, dtype=float).reshape(-1, QUESTION_COUNT, len(PARTS))
+
+
+def test_whole_marks_round_trip():
+    marks = marks_array(
+        [i % 16 for i in range(len(MARK_COLUMNS))],
+        [15] * len(MARK_COLUMNS),
+        [0] * len(MARK_COLUMNS),
+    )
+    blobs = pack_marks(marks)
+    assert all(len(blob) == PACKED_MARKS_SIZE for blob in blobs)
+    assert np.array_equal(unpack_marks(blobs), marks)
+
+
+def test_packed_blob_hex_has_one_digit_per_mark():
+    marks = marks_array(list(range(1, 10)) + [0] * (len(MARK_COLUMNS) - 9))
+    assert pack_marks(marks)[0].hex().startswith("123456789")
+
+
+@pytest.mark.parametrize("mark", [0.5, 7.5, -1, 16, 40])
+def test_marks_that_do_not_fit_are_not_packed(mark):
+    values = [1] * len(MARK_COLUMNS)
+    values[5] = mark
+    blobs = pack_marks(marks_array(values, [2] * len(MARK_COLUMNS)))
+    assert blobs[0] is None
+    assert np.array_equal(unpack_marks([blobs[1]]), marks_array([2] * 24))
+
+
+@pytest.mark.parametrize("packed", [False, True])
+def test_stored_marks_read_back_unchanged(results_db, monkeypatch, packed):
+    monkeypatch.setattr(database, "PACKED_MARKS", packed)
+    whole = {f"Q{q}": {p: q for p in PARTS} for q in range(1, QUESTION_COUNT + 1)}
+    halves = {f"Q{q}": {p: q + 0.5 for p in PARTS} for q in range(1, 7)}
+    results_db.save_results(
+        [
+            {"roll_number": "A1", "questions": whole, "total_marks": 20},
+            {"roll_number": "A2", "questions": halves, "total_marks": 23},
+        ],
+        "FY",
+        "java",
+        "MID1",
+        "2024",
+    )
+
+    matrix = build_mark_matrix(list(results_db.iter_mark_rows("FY", "java", "MID1")))
+    assert matrix.roll_numbers.tolist() == ["A1", "A2"]
+    assert np.array_equal(
+        matrix.marks[0], marks_array([q for q in range(1, 7) for _ in PARTS])[0]
+    )
+    assert np.array_equal(
+        matrix.marks[1], marks_array([q + 0.5 for q in range(1, 7) for _ in PARTS])[0]
+    )
+
+    with sqlite3.connect(results_db.db_file) as conn:
+        stored = conn.execute(
+            "SELECT packed_marks IS NOT NULL FROM students_results ORDER BY roll_number"
+        ).fetchall()
+    assert stored == [(packed,), (False,)]
@@ -0,0 +1,79 @@
+import sqlite3
+
+import pytest
+
+from conftest import make_students
+from ingest import save_scanned_results
+from rollmatch import RollNumberIndex
+
+
+@pytest.fixture
+def index(tmp_path):
+    db_file = str(tmp_path / "education.db")
+    make_students(db_file, ["A1000", "B2001", "B2002", "c3000"])
+    return RollNumberIndex(db_file)
+
+
+def entries(*roll_numbers):
+    return [{"roll_number": roll_number} for roll_number in roll_numbers]
+
+
+def test_exact_reads_are_left_alone(index):
+    batch = entries("A1000", "c3000")
+    report = index.resolve(batch)
+    assert report["exact"] == 2
+    assert [entry["roll_number"] for entry in batch] == ["A1000", "c3000"]
+    assert all("roll_number_check" not in entry for entry in batch)
+
+
+def test_near_misses_snap_to_the_stored_id(index):
+    batch = entries("A10O0", "C3000")
+    report = index.resolve(batch)
+    assert report["snapped"] == 2
+    assert [entry["roll_number"] for entry in batch] == ["A1000", "c3000"]
+    assert batch[1]["roll_number_check"] == {
+        "status": "snapped",
+        "read_as": "C3000",
+        "candidates": ["c3000"],
+    }
+
+
+def test_ambiguous_reads_are_flagged_not_rewritten(index):
+    batch = entries("B2003")
+    report = index.resolve(batch)
+    assert report["ambiguous"] == 1
+    assert batch[0]["roll_number"] == "B2003"
+    assert batch[0]["roll_number_check"]["candidates"] == ["B2001", "B2002"]
+    assert report["flagged"][0]["status"] == "ambiguous"
+
+
+def test_snaps_onto_a_batch_entry_conflict(index):
+    batch = entries("A1000", "A10O0")
+    report = index.resolve(batch)
+    assert report["exact"] == 1 and report["conflict"] == 1
+    assert batch[1]["roll_number"] == "A10O0"
+    assert batch[1]["roll_number_check"]["candidates"] == ["A1000"]
+
+
+def test_snaps_onto_a_saved_result_conflict(index):
+    batch = entries("A10O0")
+    report = index.resolve(batch, saved={"A1000"})
+    assert report["conflict"] == 1
+    assert batch[0]["roll_number"] == "A10O0"
+
+
+def test_misread_scan_does_not_overwrite_stored_marks(results_db):
+    make_students(results_db.users_db_file, ["A23126551134"])
+    cohort = ("FY", "java", "MID1", "2024")
+
+    stored = {"roll_number": "A23126551134", "questions": {}, "total_marks": 24}
+    save_scanned_results(results_db, [stored], *cohort)
+    misread = {"roll_number": "A23126551135", "questions": {}, "total_marks": 33}
+    _, report = save_scanned_results(results_db, [misread], *cohort)
+
+    assert report["conflict"] == 1
+    with sqlite3.connect(results_db.db_file) as conn:
+        rows = conn.execute(
+            "SELECT roll_number, total_marks FROM students_results ORDER BY 1"
+        ).fetchall()
+    assert rows == [("A23126551134", 24.0), ("A23126551135", 33.0)]
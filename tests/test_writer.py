@@ -0,0 +1,30 @@
+import sqlite3
+
+import pytest
+
+from writer import WriteQueue
+
+
+def test_run_raises_when_write_lock_is_held(tmp_path):
+    db_file = str(tmp_path / "results.db")
+    with sqlite3.connect(db_file) as conn:
+        conn.execute("CREATE TABLE marks (value INTEGER)")
+
+    holder = sqlite3.connect(db_file, isolation_level=None)
+    holder.execute("BEGIN IMMEDIATE")
+    writer = WriteQueue(lambda: sqlite3.connect(db_file, timeout=0.1))
+    try:
+        future = writer.submit(
+            lambda cursor: cursor.execute("INSERT INTO marks VALUES (1)")
+        )
+        with pytest.raises(sqlite3.OperationalError):
+            future.result(timeout=5)
+        assert future.done()
+    finally:
+        holder.execute("ROLLBACK")
+        holder.close()
+
+    # The writer thread survives the failed batch
+    writer.run(lambda cursor: cursor.execute("INSERT INTO marks VALUES (2)"))
+    with sqlite3.connect(db_file) as conn:
+        assert conn.execute("SELECT value FROM marks").fetchall() == [(2,)]
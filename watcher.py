@@ -0,0 +1,408 @@
+"""Watch-folder ingestion worker for scanner output
+
+Scans dropped under WATCH_DIR/<class>/<subject>/<exam type>/ are extracted
+and saved like browser uploads. Run next to the app:
+
+    python watcher.py /mnt/scans
+    python watcher.py /mnt/scans --class FY --subject java --exam-type MID1
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import os
+import select
+import signal
+import sqlite3
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from database import ResultsDatabase
+from ingest import is_scan, process_scan, save_scanned_results
+
+WATCH_MANIFEST_FILE = os.getenv("WATCH_MANIFEST_FILE", "./database/ingest_manifest.db")
+# A file must keep the same size and mtime this long before it is read
+WATCH_SETTLE_SECONDS = float(os.getenv("WATCH_SETTLE_SECONDS", 3))
+# Full rescans: the only change detection when inotify is unavailable, and a
+# safety net for network shares, whose remote writes inotify does not see
+WATCH_POLL_INTERVAL = float(os.getenv("WATCH_POLL_INTERVAL", 5))
+WATCH_RESCAN_INTERVAL = float(os.getenv("WATCH_RESCAN_INTERVAL", 60))
+WATCH_BATCH_SIZE = int(os.getenv("WATCH_BATCH_SIZE", 20))
+WATCH_WORKERS = int(os.getenv("WATCH_WORKERS", 4))
+WATCH_MAX_ATTEMPTS = int(os.getenv("WATCH_MAX_ATTEMPTS", 3))
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+INOTIFY_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class Inotify:
+    """Minimal recursive inotify watcher over libc via ctypes (Linux only)"""
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._dirs = {}
+
+    def watch_tree(self, root):
+        for dirpath, _, _ in os.walk(root):
+            self.watch(dirpath)
+
+    def watch(self, path):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), INOTIFY_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+        self._dirs[wd] = path
+
+    def read(self, timeout):
+        """Wait up to timeout seconds; returns (changed file paths, overflowed)"""
+        paths = set()
+        overflowed = False
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return paths, overflowed
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return paths, overflowed
+
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                overflowed = True
+                continue
+            if wd not in self._dirs:
+                continue
+            path = os.path.join(self._dirs[wd], name)
+            if mask & IN_ISDIR:
+                # New folders get watched, and files already in them scanned
+                self.watch_tree(path)
+                overflowed = True
+            else:
+                paths.add(path)
+        return paths, overflowed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Manifest:
+    """Durable record of every scan seen, so restarts skip finished files
+
+    A file is identified by its path, size and mtime; replacing it with new
+    content makes it pending again.
+    """
+
+    def __init__(self, db_file=WATCH_MANIFEST_FILE):
+        self.db_file = db_file
+        with self.get_connection() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS scan_files (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    result_count INTEGER NOT NULL DEFAULT 0,
+                    class_year TEXT,
+                    subject TEXT,
+                    exam_type TEXT,
+                    academic_year TEXT,
+                    error TEXT,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """
+            )
+            # A crash mid-batch leaves files marked processing; saving is an
+            # upsert, so they are simply processed again
+            conn.execute(
+                "UPDATE scan_files SET status = 'pending' WHERE status = 'processing'"
+            )
+
+    def get_connection(self):
+        return sqlite3.connect(self.db_file)
+
+    def settled(self):
+        """{path: (size, mtime_ns)} of files that need no more work"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT path, size, mtime_ns FROM scan_files
+                WHERE status IN ('done', 'skipped')
+                   OR (status = 'failed' AND attempts >= ?)
+            """,
+                (WATCH_MAX_ATTEMPTS,),
+            )
+            return {path: (size, mtime_ns) for path, size, mtime_ns in cursor}
+
+    def start(self, files, cohort, academic_year):
+        """Mark (path, size, mtime_ns) files as being processed"""
+        with self.get_connection() as conn:
+            conn.executemany(
+                """
+                INSERT INTO scan_files
+                (path, size, mtime_ns, status, attempts, class_year, subject,
+                 exam_type, academic_year)
+                VALUES (?, ?, ?, 'processing', 1, ?, ?, ?, ?)
+                ON CONFLICT (path) DO UPDATE SET
+                    attempts = CASE
+                        WHEN size = excluded.size AND mtime_ns = excluded.mtime_ns
+                        THEN attempts + 1 ELSE 1 END,
+                    size = excluded.size, mtime_ns = excluded.mtime_ns,
+                    status = 'processing', class_year = excluded.class_year,
+                    subject = excluded.subject, exam_type = excluded.exam_type,
+                    academic_year = excluded.academic_year, error = NULL,
+                    updated_at = CURRENT_TIMESTAMP
+            """,
+                [(*file, *cohort, academic_year) for file in files],
+            )
+
+    def finish(self, outcomes):
+        """Record (path, status, result_count, error) outcomes in one commit"""
+        with self.get_connection() as conn:
+            conn.executemany(
+                """
+                UPDATE scan_files
+                SET status = ?, result_count = ?, error = ?,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE path = ?
+            """,
+                [
+                    (status, count, error, path)
+                    for path, status, count, error in outcomes
+                ],
+            )
+
+    def skip(self, path, size, mtime_ns, reason):
+        with self.get_connection() as conn:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO scan_files
+                (path, size, mtime_ns, status, error)
+                VALUES (?, ?, ?, 'skipped', ?)
+            """,
+                (path, size, mtime_ns, reason),
+            )
+
+    def get_stats(self):
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT status, COUNT(*), SUM(result_count) FROM scan_files GROUP BY status"
+            )
+            return {
+                status: {"files": files, "results": results or 0}
+                for status, files, results in cursor.fetchall()
+            }
+
+
+class ScanWatcher:
+    """Feeds scans dropped into a folder through extraction and save_results
+
+    Files are picked up from inotify events (or periodic rescans), held
+    until they stop changing for WATCH_SETTLE_SECONDS, then extracted on a
+    thread pool and saved per exam in batches of WATCH_BATCH_SIZE files.
+    """
+
+    def __init__(self, watch_dir, results_db, manifest, default_cohort=None):
+        self.watch_dir = os.path.abspath(watch_dir)
+        self.results_db = results_db
+        self.manifest = manifest
+        self.default_cohort = default_cohort
+        self._settled = manifest.settled()
+        # path -> (size, mtime_ns, unchanged since)
+        self._pending = {}
+        self._running = True
+        self._inotify = None
+
+    def cohort_for(self, path):
+        """(class_year, subject, exam_type) from the folder a scan is in"""
+        parts = os.path.relpath(path, self.watch_dir).split(os.sep)[:-1]
+        if len(parts) >= 3:
+            return tuple(parts[:3])
+        return self.default_cohort
+
+    def stop(self, *_):
+        self._running = False
+
+    def scan(self):
+        """Every file under the folder"""
+        return {
+            os.path.join(dirpath, filename)
+            for dirpath, _, filenames in os.walk(self.watch_dir)
+            for filename in filenames
+        }
+
+    def _track(self, paths):
+        now = time.monotonic()
+        for path in paths:
+            filename = os.path.basename(path)
+            # Dot files are usually a copy still in progress
+            if not is_scan(filename) or filename.startswith("."):
+                continue
+            if path not in self._pending:
+                self._pending[path] = (None, None, now)
+
+    def _ready(self):
+        """Pending files that exist and have not changed for the settle time"""
+        now = time.monotonic()
+        ready = []
+        for path, (size, mtime_ns, since) in list(self._pending.items()):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                del self._pending[path]
+                continue
+            current = (stat.st_size, stat.st_mtime_ns)
+            if self._settled.get(path) == current:
+                del self._pending[path]
+            elif current != (size, mtime_ns):
+                self._pending[path] = (*current, now)
+            elif now - since >= WATCH_SETTLE_SECONDS:
+                ready.append((path, *current))
+        return ready
+
+    def process(self, files):
+        """Extract and save ready (path, size, mtime_ns) files, batched per exam"""
+        academic_year = str(datetime.now().year)
+        by_cohort = {}
+        for path, size, mtime_ns in files:
+            del self._pending[path]
+            cohort = self.cohort_for(path)
+            if cohort is None:
+                self.manifest.skip(path, size, mtime_ns, "No class/subject/exam folder")
+                self._settled[path] = (size, mtime_ns)
+                continue
+            by_cohort.setdefault(cohort, []).append((path, size, mtime_ns))
+
+        for cohort, cohort_files in by_cohort.items():
+            for start in range(0, len(cohort_files), WATCH_BATCH_SIZE):
+                self._process_batch(
+                    cohort,
+                    cohort_files[start : start + WATCH_BATCH_SIZE],
+                    academic_year,
+                )
+
+    def _process_batch(self, cohort, files, academic_year):
+        self.manifest.start(files, cohort, academic_year)
+        paths = [path for path, _, _ in files]
+        with ThreadPoolExecutor(max_workers=WATCH_WORKERS) as pool:
+            extracted = list(pool.map(self._extract, paths))
+
+        results = [result for file_results, _ in extracted for result in file_results]
+        error = None
+        if results:
+            try:
+                saved, roll_numbers = save_scanned_results(
+                    self.results_db, results, *cohort, academic_year
+                )
+                if not saved:
+                    error = "No results saved"
+                elif roll_numbers["flagged"]:
+                    print(f"Roll numbers to review: {roll_numbers['flagged']}")
+            except Exception as e:
+                error = str(e)
+
+        outcomes = []
+        for (path, size, mtime_ns), (file_results, file_error) in zip(files, extracted):
+            file_error = file_error or error
+            if not file_results and not file_error:
+                file_error = "No valid data extracted"
+            status = "failed" if file_error else "done"
+            outcomes.append((path, status, len(file_results), file_error))
+        self.manifest.finish(outcomes)
+        # Failed files are retried on a later rescan until out of attempts
+        self._settled = self.manifest.settled()
+        print(
+            f"Ingested {len(results)} results from {len(files)} scans "
+            f"for {'/'.join(cohort)}"
+        )
+
+    @staticmethod
+    def _extract(path):
+        try:
+            return process_scan(path), None
+        except Exception as e:
+            print(f"Error processing {path}: {str(e)}")
+            return [], str(e)
+
+    def run(self, once=False):
+        """Watch until stopped; with once, process what is there and return"""
+        try:
+            self._inotify = Inotify()
+            self._inotify.watch_tree(self.watch_dir)
+        except (AttributeError, OSError) as e:
+            print(f"inotify unavailable ({e}), polling every {WATCH_POLL_INTERVAL}s")
+            self._inotify = None
+        rescan_interval = (
+            WATCH_RESCAN_INTERVAL if self._inotify else WATCH_POLL_INTERVAL
+        )
+
+        next_rescan = 0
+        try:
+            while self._running:
+                if time.monotonic() >= next_rescan:
+                    self._track(self.scan())
+                    next_rescan = time.monotonic() + rescan_interval
+
+                ready = self._ready()
+                if ready:
+                    self.process(ready)
+                if once and not self._pending:
+                    return
+
+                # Short waits so a stop signal is noticed promptly
+                wait = min(1.0, max(next_rescan - time.monotonic(), 0))
+                if self._inotify:
+                    changed, overflowed = self._inotify.read(wait)
+                    self._track(changed)
+                    if overflowed:
+                        next_rescan = 0
+                else:
+                    time.sleep(wait)
+        finally:
+            if self._inotify:
+                self._inotify.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("watch_dir", nargs="?", default=os.getenv("WATCH_DIR"))
+    parser.add_argument("--class", dest="class_year", help="class for loose scans")
+    parser.add_argument("--subject", help="subject for loose scans")
+    parser.add_argument("--exam-type", help="exam type for loose scans")
+    parser.add_argument(
+        "--once", action="store_true", help="process current scans and exit"
+    )
+    args = parser.parse_args()
+    if not args.watch_dir:
+        parser.error("watch_dir (or WATCH_DIR) is required")
+
+    default_cohort = (args.class_year, args.subject, args.exam_type)
+    watcher = ScanWatcher(
+        args.watch_dir,
+        ResultsDatabase(reset=False),
+        Manifest(),
+        default_cohort if all(default_cohort) else None,
+    )
+    signal.signal(signal.SIGTERM, watcher.stop)
+    signal.signal(signal.SIGINT, watcher.stop)
+    watcher.run(once=args.once)
+    print(f"Manifest: {watcher.manifest.get_stats()}")
+
+
+if __name__ == "__main__":
+    main()
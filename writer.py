@@ -0,0 +1,163 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+# Jobs allowed to wait for the writer before callers are turned away
+WRITE_QUEUE_LIMIT = int(os.getenv("RESULTS_WRITE_QUEUE_LIMIT", 256))
+WRITE_WAIT_TIMEOUT = float(os.getenv("RESULTS_WRITE_WAIT_TIMEOUT", 10))
+# Jobs arriving within this many seconds of the first share one transaction
+WRITE_BATCH_WINDOW = float(os.getenv("RESULTS_WRITE_BATCH_WINDOW", 0.005))
+WRITE_BATCH_SIZE = int(os.getenv("RESULTS_WRITE_BATCH_SIZE", 128))
+
+
+class WriterBusy(Exception):
+    """Raised when the write queue is full for longer than the timeout"""
+
+
+class WriteQueue:
+    """Serializes database writes through one thread and one connection
+
+    A job is a callable taking a cursor. Jobs that arrive within
+    ``batch_window`` of each other are committed in a single transaction,
+    each inside its own savepoint, so a failing job is rolled back alone.
+    submit() returns a Future that resolves once the transaction commits.
+    """
+
+    def __init__(
+        self,
+        connect,
+        queue_limit=WRITE_QUEUE_LIMIT,
+        wait_timeout=WRITE_WAIT_TIMEOUT,
+        batch_window=WRITE_BATCH_WINDOW,
+        batch_size=WRITE_BATCH_SIZE,
+    ):
+        self._connect = connect
+        self.queue_limit = queue_limit
+        self.wait_timeout = wait_timeout
+        self.batch_window = batch_window
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=queue_limit)
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self._jobs = 0
+        self._failed = 0
+        self._rejected = 0
+        self._transactions = 0
+        self._max_batch = 0
+        self._commit_times = deque(maxlen=1000)
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._loop, name="results-writer", daemon=True
+                )
+                self._thread.start()
+
+    def submit(self, job):
+        """Queue a job; returns a Future with its result or exception"""
+        self._ensure_thread()
+        future = Future()
+        try:
+            self._queue.put((job, future), timeout=self.wait_timeout)
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            raise WriterBusy("Results write queue is full")
+        return future
+
+    def run(self, job):
+        """Queue a job and wait for it to commit"""
+        return self.submit(job).result()
+
+    def _loop(self):
+        conn = self._connect()
+        conn.isolation_level = None
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0:
+                        batch.append(self._queue.get(timeout=remaining))
+                    else:
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._commit(conn, batch)
+
+    def _commit(self, conn, batch):
+        start = time.perf_counter()
+        outcomes = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for job, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT job")
+                try:
+                    result = job(conn.cursor())
+                except Exception as e:
+                    conn.execute("ROLLBACK TO job")
+                    conn.execute("RELEASE job")
+                    outcomes.append((future, None, e))
+                else:
+                    conn.execute("RELEASE job")
+                    outcomes.append((future, result, None))
+            conn.execute("COMMIT")
+        except Exception as e:
+            try:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+            # Nothing in the batch was committed, including jobs that never
+            # ran because BEGIN itself failed
+            for job, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            with self._lock:
+                self._failed += len(batch)
+            print(f"Results write batch failed: {e}")
+            return
+
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._transactions += 1
+            self._jobs += len(outcomes)
+            self._failed += sum(1 for _, _, error in outcomes if error)
+            self._max_batch = max(self._max_batch, len(outcomes))
+            self._commit_times.append(elapsed)
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def get_stats(self):
+        with self._lock:
+            stats = {
+                "queue_limit": self.queue_limit,
+                "queue_depth": self._queue.qsize(),
+                "batch_window_ms": round(self.batch_window * 1000, 2),
+                "jobs": self._jobs,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "transactions": self._transactions,
+                "max_batch": self._max_batch,
+            }
+            commit_times = list(self._commit_times)
+        if self._transactions:
+            stats["average_batch"] = round(self._jobs / self._transactions, 2)
+        if commit_times:
+            stats["transaction_ms"] = {
+                "average": round(sum(commit_times) / len(commit_times) * 1000, 2),
+                "max": round(max(commit_times) * 1000, 2),
+            }
+        return stats